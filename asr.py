@@ -0,0 +1,355 @@
+"""Speech recognition helpers shared by the pipeline and its worker processes.
+
+This module deliberately does not import pipeline.py, so spawned worker
+processes can load it without API keys or the VAD model.
+"""
+
+import os
+import time
+import threading
+import multiprocessing
+
+from startup import record
+
+SAMPLING_RATE = 16000
+
+# Engine selection — ASR_BACKEND is "whisper" (openai-whisper, PyTorch fp32)
+# or "ctranslate2" (faster-whisper, quantized CTranslate2 on CPU)
+ASR_BACKEND = os.environ.get("ASR_BACKEND", "whisper").lower()
+ASR_MODEL = os.environ.get("ASR_MODEL", "base")
+ASR_COMPUTE_TYPE = os.environ.get("ASR_COMPUTE_TYPE", "int8")
+ASR_CPU_THREADS = int(os.environ.get("ASR_CPU_THREADS", "0"))  # 0 = library default
+
+# Decode settings shared by every backend
+WHISPER_OPTIONS = {
+    "temperature": 0,
+    "beam_size": 1,
+    "best_of": 1,
+    "condition_on_previous_text": False,
+    "no_speech_threshold": 0.8,
+    "compression_ratio_threshold": 2.4,
+}
+
+# Long-audio mode — VAD segments are grouped into chunks of roughly this length
+CHUNK_MIN_SECONDS = 30
+CHUNK_MAX_SECONDS = 60
+
+
+class WhisperEngine:
+    """openai-whisper running in PyTorch fp32 on CPU."""
+
+    name = "whisper"
+
+    def __init__(self, model_name, cpu_threads=0):
+        import torch
+        import whisper
+
+        if cpu_threads:
+            torch.set_num_threads(cpu_threads)
+        self.model_name = model_name
+        self.compute_type = "float32"
+        self.model = whisper.load_model(model_name)
+
+    def transcribe(self, audio):
+        result = self.model.transcribe(audio, fp16=False, **WHISPER_OPTIONS)
+        segments = [
+            {"start": seg["start"], "end": seg["end"], "text": seg["text"]}
+            for seg in result["segments"]
+        ]
+        return {"text": result["text"], "segments": segments}
+
+
+class CTranslate2Engine:
+    """faster-whisper: Whisper converted to CTranslate2, quantized for CPU."""
+
+    name = "ctranslate2"
+
+    def __init__(self, model_name, compute_type="int8", cpu_threads=0):
+        try:
+            from faster_whisper import WhisperModel
+        except ImportError:
+            raise RuntimeError("ASR_BACKEND=ctranslate2 requires the faster-whisper package")
+
+        self.model_name = model_name
+        self.compute_type = compute_type
+        self.model = WhisperModel(
+            model_name, device="cpu", compute_type=compute_type, cpu_threads=cpu_threads
+        )
+
+    def transcribe(self, audio):
+        segments, _info = self.model.transcribe(audio, **WHISPER_OPTIONS)
+        # faster-whisper yields segments lazily; decoding happens here
+        segments = [{"start": seg.start, "end": seg.end, "text": seg.text} for seg in segments]
+        return {"text": "".join(seg["text"] for seg in segments), "segments": segments}
+
+
+def load_engine(cpu_threads=ASR_CPU_THREADS):
+    """Build the ASR engine selected by ASR_BACKEND / ASR_MODEL / ASR_COMPUTE_TYPE."""
+    if ASR_BACKEND in ("ctranslate2", "faster-whisper"):
+        return CTranslate2Engine(ASR_MODEL, ASR_COMPUTE_TYPE, cpu_threads)
+    if ASR_BACKEND == "whisper":
+        return WhisperEngine(ASR_MODEL, cpu_threads)
+    raise ValueError(f"Unknown ASR_BACKEND: {ASR_BACKEND}")
+
+
+def transcription_params():
+    """Engine settings that change the transcript, used in transcript cache keys."""
+    return {
+        "backend": "ctranslate2" if ASR_BACKEND == "faster-whisper" else ASR_BACKEND,
+        "model": ASR_MODEL,
+        "compute_type": ASR_COMPUTE_TYPE if ASR_BACKEND != "whisper" else "float32",
+        "options": WHISPER_OPTIONS,
+        "chunk_seconds": [CHUNK_MIN_SECONDS, CHUNK_MAX_SECONDS],
+    }
+
+
+class SpanGrouper:
+    """Group speech segments into (start, end) sample spans as they arrive.
+
+    A span is closed once it covers at least min_seconds, or before adding a
+    segment would stretch it past max_seconds. Speech segments longer than
+    max_seconds are split into max_seconds pieces. Cuts therefore fall in
+    the silence between VAD segments wherever possible.
+    """
+
+    def __init__(self, min_seconds=CHUNK_MIN_SECONDS, max_seconds=CHUNK_MAX_SECONDS,
+                 sampling_rate=SAMPLING_RATE):
+        self.min_samples = int(min_seconds * sampling_rate)
+        self.max_samples = int(max_seconds * sampling_rate)
+        self.open_start = None
+        self.open_end = None
+
+    def add(self, start, end):
+        """Add one segment; return the spans it closed."""
+        closed = []
+        while end - start > self.max_samples:
+            closed += self._add_piece(start, start + self.max_samples)
+            start += self.max_samples
+        return closed + self._add_piece(start, end)
+
+    def expire(self, position):
+        """Close the open span once it can no longer grow; return the spans closed.
+
+        `position` is the earliest sample a future segment can end after.
+        Any such segment would stretch the span past max_seconds, so it is
+        closed now instead of being held through a long silence.
+        """
+        if self.open_start is not None and position - self.open_start >= self.max_samples:
+            return self.flush()
+        return []
+
+    def flush(self):
+        """Close and return the span still open, if any."""
+        if self.open_start is None:
+            return []
+        span = (self.open_start, self.open_end)
+        self.open_start = None
+        return [span]
+
+    def _add_piece(self, start, end):
+        closed = []
+        if self.open_start is not None and end - self.open_start > self.max_samples:
+            closed += self.flush()
+        if self.open_start is None:
+            self.open_start = start
+        self.open_end = end
+        if self.open_end - self.open_start >= self.min_samples:
+            closed += self.flush()
+        return closed
+
+
+def retained_from(*positions):
+    """First sample a streaming buffer must keep: the earliest of `positions`.
+
+    Positions that are None (no segment or span open) are ignored.
+    """
+    return min(position for position in positions if position is not None)
+
+
+# ---------------------------------------------------------------------------
+# Supervised worker process — warm across jobs, killed on timeout
+# ---------------------------------------------------------------------------
+WORKER_LOAD_TIMEOUT_SECONDS = 600  # time allowed for a fresh worker to load its model
+
+
+class WorkerTimeout(Exception):
+    """The worker did not answer in time and has been killed."""
+
+
+def _serve(conn):
+    start = time.monotonic()
+    engine = load_engine()
+    conn.send(("ready", time.monotonic() - start))
+    while True:
+        try:
+            audio = conn.recv()
+        except EOFError:
+            return
+        try:
+            conn.send(("ok", engine.transcribe(audio)))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+class TranscriptionWorker:
+    """An ASR engine running in a child process that can be killed.
+
+    The engine is loaded once and reused for every job. If a job overruns
+    its timeout the process is killed outright, freeing the CPU, and a
+    fresh worker is started on the next call.
+    """
+
+    def __init__(self, name="asr-worker"):
+        self.name = name
+        self._ctx = multiprocessing.get_context("spawn")
+        self._process = None
+        self._conn = None
+        self._ready = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the process if it is not running. Does not wait for the model."""
+        if self._process is not None and self._process.is_alive():
+            return
+        self._discard()
+        parent_conn, child_conn = self._ctx.Pipe()
+        self._process = self._ctx.Process(target=_serve, args=(child_conn,), name=self.name, daemon=True)
+        self._process.start()
+        child_conn.close()
+        self._conn = parent_conn
+        self._ready = False
+        print(f"[ASR] Started {self.name} (pid {self._process.pid})")
+
+    def wait_ready(self, timeout=WORKER_LOAD_TIMEOUT_SECONDS):
+        with self._lock:
+            self._wait_ready(timeout)
+
+    def transcribe(self, audio, timeout):
+        """Transcribe in the worker. Raises WorkerTimeout after `timeout` seconds."""
+        with self._lock:
+            self._wait_ready(WORKER_LOAD_TIMEOUT_SECONDS)
+            self._conn.send(audio)
+            status, payload = self._receive(timeout)
+            if status == "error":
+                raise RuntimeError(f"ASR worker failed: {payload}")
+            return payload
+
+    def kill(self):
+        if self._process is not None and self._process.is_alive():
+            print(f"[ASR] Killing {self.name} (pid {self._process.pid})")
+            self._process.kill()
+        self._discard()
+
+    def _wait_ready(self, timeout):
+        self.start()
+        if self._ready:
+            return
+        status, load_seconds = self._receive(timeout)
+        self._ready = True
+        record(f"load ASR ({ASR_BACKEND} {ASR_MODEL}) in {self.name}", load_seconds)
+
+    def _receive(self, timeout):
+        try:
+            if self._conn.poll(timeout):
+                return self._conn.recv()
+        except (EOFError, OSError):
+            self.kill()
+            raise RuntimeError(f"{self.name} exited unexpectedly")
+        self.kill()
+        raise WorkerTimeout(f"{self.name} did not respond within {timeout} seconds")
+
+    def _discard(self):
+        if self._process is not None:
+            self._process.join(timeout=5)
+        if self._conn is not None:
+            self._conn.close()
+        self._process = None
+        self._conn = None
+        self._ready = False
+
+
+# ---------------------------------------------------------------------------
+# Process pool workers — each worker loads its own engine once, and the pool
+# is kept for the next long recording
+# ---------------------------------------------------------------------------
+_worker_engine = None
+_pool = None
+_pool_workers = None
+# One long recording at a time: it already has every pool worker, and a
+# timeout terminates the pool under everyone using it
+_pool_lock = threading.Lock()
+
+
+def _init_worker(threads):
+    global _worker_engine
+    _worker_engine = load_engine(cpu_threads=threads)
+
+
+def _transcribe_chunk(task):
+    index, offset, audio = task
+    result = _worker_engine.transcribe(audio)
+    segments = [
+        {"start": seg["start"] + offset, "end": seg["end"] + offset, "text": seg["text"]}
+        for seg in result["segments"]
+    ]
+    return index, result["text"], segments
+
+
+def _long_audio_pool(workers):
+    """The warm long-audio pool, started on first use or after it was terminated."""
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        _terminate_pool()
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        print(f"[ASR] Starting long-audio pool: {workers} workers, {threads} threads each")
+        _pool = multiprocessing.get_context("spawn").Pool(workers, initializer=_init_worker, initargs=(threads,))
+        _pool_workers = workers
+    return _pool
+
+
+def _terminate_pool():
+    global _pool, _pool_workers
+    if _pool is not None:
+        _pool.terminate()
+        _pool.join()
+    _pool = None
+    _pool_workers = None
+
+
+def transcribe_chunks(chunks, workers, timeout):
+    """Transcribe (offset_seconds, float32 array) chunks across a process pool.
+
+    `chunks` may be a lazy iterator: the pool consumes it from its feeder
+    thread, so chunks are transcribed while later ones are still being
+    decoded. Returns {"text", "segments"} with chunks stitched back together
+    in order and segment times shifted by each chunk's offset into the
+    recording. Raises multiprocessing.TimeoutError if the whole batch
+    exceeds `timeout`.
+
+    The pool and its models outlive the call, so only the first long
+    recording pays for loading `workers` engines. A timeout terminates the
+    pool, which frees the CPU, and the next call starts a fresh one.
+    """
+    workers = max(1, workers)
+    tasks = ((i, offset, audio) for i, (offset, audio) in enumerate(chunks))
+    results = []
+    with _pool_lock:
+        pool = _long_audio_pool(workers)
+        print(f"[TRANSCRIBING] Long-audio mode: chunks across {workers} workers")
+        deadline = time.monotonic() + timeout
+        pending = pool.imap(_transcribe_chunk, tasks)
+        while True:
+            try:
+                results.append(pending.next(timeout=max(0, deadline - time.monotonic())))
+            except StopIteration:
+                break
+            except multiprocessing.TimeoutError:
+                _terminate_pool()
+                raise
+            if len(results) == 1:
+                print(f"[TRANSCRIBING] First chunk done after {timeout - (deadline - time.monotonic()):.1f}s")
+
+    text = " ".join(t.strip() for _, t, _ in results if t.strip())
+    segments = [seg for _, _, segs in results for seg in segs]
+    print(f"[TRANSCRIBING] Long-audio mode: stitched {len(results)} chunks")
+    return {"text": text, "segments": segments}
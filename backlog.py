@@ -0,0 +1,311 @@
+"""Backlog mode — bulk note generation through the Message Batches API.
+
+For re-processing archives and catching up after downtime, where
+throughput and cost matter more than per-file latency. Every recording is
+transcribed locally (transcript cache and checkpoints still apply), then
+the single-shot note requests are submitted as one Message Batch. The
+batch is polled until it ends and the finished notes are written to the
+vault in bulk.
+
+Usage:
+    python backlog.py [--local] [--keep] PATH [PATH ...]
+
+PATH may be audio files or folders of them. --local swaps the batch
+endpoint for LocalBatchClient, which answers offline with placeholder
+notes, and sizes requests from the local token estimate, so the whole
+mode can be exercised without network access.
+--keep leaves the audio in place instead of archiving it.
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+import concurrent.futures
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pipeline
+import checkpoints
+import clients
+from clients import OBSIDIAN_POOL_SIZE, anthropic_client
+from obsidian import ObsidianError
+
+BATCH_POLL_SECONDS = float(os.environ.get("BATCH_POLL_SECONDS", "30"))
+BATCH_MAX_REQUESTS = int(os.environ.get("BATCH_MAX_REQUESTS", "1000"))
+BATCH_TIMEOUT_SECONDS = 24 * 60 * 60  # batches expire after 24 hours
+SUPPORTED_EXTENSIONS = {".mp3", ".m4a", ".wav", ".ogg", ".flac"}
+
+
+# ---------------------------------------------------------------------------
+# Local stand-in for the batch endpoint
+# ---------------------------------------------------------------------------
+def offline_note(params):
+    """Placeholder reply for LocalBatchClient: a minimal note naming the file."""
+    prompt = params["messages"][0]["content"]
+    filename = prompt.split("\n", 1)[0].removeprefix("Audio file: ").strip()
+    text = (
+        f"---\nsource: {filename}\ngenerated: offline\n---\n\n"
+        f"# {os.path.splitext(filename)[0]}\n\n"
+        "## Summary\n\nPlaceholder note from the local batch stand-in.\n"
+    )
+    return SimpleNamespace(
+        content=[SimpleNamespace(type="text", text=text)],
+        stop_reason="end_turn",
+        usage=SimpleNamespace(input_tokens=len(prompt) // 4, output_tokens=len(text) // 4,
+                              cache_creation_input_tokens=0, cache_read_input_tokens=0),
+    )
+
+
+class LocalBatches:
+    """The subset of client.messages.batches used here, answered in-process.
+
+    Requests are worked through on a background thread by `respond`, a
+    callable taking one request's params and returning a Message-like
+    object, so polling sees the batch go from in_progress to ended.
+    """
+
+    def __init__(self, respond=offline_note):
+        self._respond = respond
+        self._batches = {}
+        self._lock = threading.Lock()
+
+    def create(self, requests):
+        batch_id = f"msgbatch_local_{len(self._batches) + 1:04d}"
+        batch = {"requests": list(requests), "results": [], "status": "in_progress"}
+        with self._lock:
+            self._batches[batch_id] = batch
+        threading.Thread(target=self._run, args=(batch,), daemon=True).start()
+        return self.retrieve(batch_id)
+
+    def retrieve(self, batch_id):
+        with self._lock:
+            batch = self._batches[batch_id]
+            succeeded = sum(r.result.type == "succeeded" for r in batch["results"])
+            done = len(batch["results"])
+            status = batch["status"]
+        return SimpleNamespace(
+            id=batch_id,
+            processing_status=status,
+            request_counts=SimpleNamespace(
+                processing=len(batch["requests"]) - done, succeeded=succeeded,
+                errored=done - succeeded, canceled=0, expired=0,
+            ),
+        )
+
+    def results(self, batch_id):
+        with self._lock:
+            return iter(list(self._batches[batch_id]["results"]))
+
+    def _run(self, batch):
+        for request in batch["requests"]:
+            try:
+                result = SimpleNamespace(type="succeeded", message=self._respond(request["params"]))
+            except Exception as e:
+                result = SimpleNamespace(type="errored", error=SimpleNamespace(message=str(e)))
+            with self._lock:
+                batch["results"].append(SimpleNamespace(custom_id=request["custom_id"], result=result))
+        with self._lock:
+            batch["status"] = "ended"
+
+
+class LocalBatchClient:
+    """Offline stand-in for the Anthropic client in backlog mode."""
+
+    def __init__(self, respond=offline_note):
+        self.messages = SimpleNamespace(batches=LocalBatches(respond))
+
+
+# ---------------------------------------------------------------------------
+# Backlog run
+# ---------------------------------------------------------------------------
+def collect_files(paths):
+    """Expand files and folders into a sorted list of supported audio files."""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found += [os.path.join(path, name) for name in sorted(os.listdir(path))]
+        else:
+            found.append(path)
+    return [
+        path for path in found
+        if os.path.isfile(path) and os.path.splitext(path)[1].lower() in SUPPORTED_EXTENSIONS
+    ]
+
+
+def prepare_job(file_path):
+    """Transcribe one file, reusing its checkpoint or cached transcript."""
+    job = pipeline.new_job(file_path)
+    pipeline.load_cached_transcript(job)
+    job["checkpoint"] = record = checkpoints.load(job["content_hash"])
+    if "transcript" in record:
+        job["transcript"] = record["transcript"]
+    if "transcript" not in job:
+        print(f"[TRANSCRIBING] {file_path}")
+        job["transcript"] = pipeline.transcribe_file(file_path)
+        pipeline.store_transcript(job)
+    if not checkpoints.done(record, checkpoints.TRANSCRIBED):
+        checkpoints.mark(record, checkpoints.TRANSCRIBED, transcript=job["transcript"])
+    return job
+
+
+def related_for(job):
+    """Related-note candidates for one job; none if Obsidian can't be listed."""
+    try:
+        return pipeline.related_notes(job["transcript"])
+    except ObsidianError as e:
+        print(f"[OBSIDIAN] Could not list {pipeline.NOTES_FOLDER} ({e}), writing without related links")
+        return []
+
+
+def run_batch(client, jobs, poll_seconds=BATCH_POLL_SECONDS):
+    """Submit single-shot note requests for `jobs` as one batch and wait for it.
+
+    Returns {content_hash: note or None}; None means the request failed or
+    the reply was unusable.
+    """
+    requests_ = [
+        {
+            "custom_id": job["content_hash"],
+            "params": pipeline.single_shot_request(
+                job["filename"], job["transcript"], job["related"], max_tokens=job["plan"]["max_tokens"]
+            ),
+        }
+        for job in jobs
+    ]
+    batch = client.messages.batches.create(requests=requests_)
+    print(f"[BATCH] Submitted {batch.id} with {len(requests_)} requests")
+
+    deadline = time.monotonic() + BATCH_TIMEOUT_SECONDS
+    while batch.processing_status != "ended":
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Batch {batch.id} did not end within {BATCH_TIMEOUT_SECONDS} seconds")
+        time.sleep(poll_seconds)
+        batch = client.messages.batches.retrieve(batch.id)
+        counts = batch.request_counts
+        print(f"[BATCH] {batch.id}: {batch.processing_status} | processing={counts.processing} "
+              f"succeeded={counts.succeeded} errored={counts.errored}")
+
+    by_hash = {job["content_hash"]: job for job in jobs}
+    notes = {}
+    for entry in client.messages.batches.results(batch.id):
+        job = by_hash.get(entry.custom_id)
+        if job is None:
+            continue
+        if entry.result.type != "succeeded":
+            print(f"[BATCH] {job['filename']}: {entry.result.type}")
+            notes[entry.custom_id] = None
+            continue
+        pipeline.log_usage(f"batch {job['filename']}", entry.result.message.usage)
+        notes[entry.custom_id] = pipeline.note_from_message(
+            job["filename"], job["transcript"], entry.result.message
+        )
+    return notes
+
+
+def finish_job(job, archive):
+    """Write the checkpointed note to the vault, then archive the audio."""
+    record = job["checkpoint"]
+    if not checkpoints.done(record, checkpoints.NOTE_WRITTEN):
+        result = pipeline.write_note(record["note_path"], record["markdown"])
+        if not result["success"]:
+            raise RuntimeError(f"Could not write note to Obsidian: {record['note_path']}")
+        checkpoints.mark(record, checkpoints.NOTE_WRITTEN)
+    if archive:
+        pipeline.archive_audio(job["file_path"])
+        checkpoints.mark(record, checkpoints.ARCHIVED)
+    print(f"[DONE] {job['filename']}")
+
+
+def run_backlog(paths, client, archive=True, poll_seconds=BATCH_POLL_SECONDS):
+    started = datetime.now(timezone.utc)
+    files = collect_files(paths)
+    print(f"[BACKLOG] {len(files)} audio files")
+
+    jobs = []
+    seen = set()
+    for file_path in files:
+        try:
+            job = prepare_job(file_path)
+        except Exception as e:
+            print(f"[ERROR] Failed to transcribe {os.path.basename(file_path)}: {e}")
+            continue
+        if checkpoints.done(job["checkpoint"], checkpoints.ARCHIVED):
+            print(f"[SKIPPED] Already processed: {job['filename']}")
+            continue
+        if job["content_hash"] in seen:
+            print(f"[SKIPPED] Duplicate recording: {job['filename']}")
+            continue
+        seen.add(job["content_hash"])
+        jobs.append(job)
+
+    # Pre-flight every prompt; the ones that need map-reduce stay on the synchronous path
+    pending = []
+    for job in jobs:
+        if checkpoints.done(job["checkpoint"], checkpoints.NOTE_GENERATED):
+            continue
+        job["related"] = related_for(job)
+        job["plan"] = pipeline.plan_note(job["filename"], job["transcript"], job["related"])
+        if job["plan"]["shape"] != "map-reduce":
+            pending.append(job)
+    if pending:
+        for i in range(0, len(pending), BATCH_MAX_REQUESTS):
+            group = pending[i:i + BATCH_MAX_REQUESTS]
+            notes = run_batch(client, group, poll_seconds)
+            for job in group:
+                note = notes.get(job["content_hash"])
+                if note is not None:
+                    checkpoints.mark(job["checkpoint"], checkpoints.NOTE_GENERATED,
+                                     note_path=note["path"], markdown=note["content"],
+                                     request=dict(job["plan"], shape="batch"))
+
+    failed = 0
+    for job in jobs:
+        if checkpoints.done(job["checkpoint"], checkpoints.NOTE_GENERATED):
+            continue
+        print(f"[BACKLOG] Generating {job['filename']} synchronously")
+        try:
+            note = pipeline.create_note(job["filename"], job["transcript"])
+        except Exception as e:
+            print(f"[ERROR] Note generation failed for {job['filename']}: {e}")
+            failed += 1
+            continue
+        checkpoints.mark(job["checkpoint"], checkpoints.NOTE_GENERATED,
+                         note_path=note["path"], markdown=note["content"], request=note["plan"])
+        if note.get("written"):
+            checkpoints.mark(job["checkpoint"], checkpoints.NOTE_WRITTEN)
+
+    ready = [job for job in jobs if checkpoints.done(job["checkpoint"], checkpoints.NOTE_GENERATED)]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=OBSIDIAN_POOL_SIZE) as executor:
+        futures = {executor.submit(finish_job, job, archive): job for job in ready}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"[ERROR] {futures[future]['filename']}: {e}")
+                failed += 1
+
+    elapsed = (datetime.now(timezone.utc) - started).total_seconds()
+    print(f"[BACKLOG] Finished {len(jobs) - failed}/{len(jobs)} files in {elapsed:.0f}s")
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate notes for a backlog of recordings in one batch.")
+    parser.add_argument("paths", nargs="+", help="audio files or folders of audio files")
+    parser.add_argument("--local", action="store_true", help="use the offline batch stand-in")
+    parser.add_argument("--keep", action="store_true", help="do not archive the audio afterwards")
+    args = parser.parse_args()
+
+    if args.local:
+        # Offline: size requests from the local estimate, never the counting endpoint
+        clients.TOKEN_COUNTING = "estimate"
+        failed = run_backlog(args.paths, LocalBatchClient(), not args.keep, poll_seconds=1)
+    else:
+        failed = run_backlog(args.paths, anthropic_client(), not args.keep)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Per-job checkpoints so a failed file resumes from its first incomplete stage.
+
+One JSON record per audio content hash holds the completed stages, with
+timestamps, and the artifacts needed to resume: the transcript, and the
+note path and markdown Claude generated. If the Obsidian write fails, a
+re-dropped file only repeats the write instead of Whisper and Claude.
+"""
+
+import os
+import json
+import tempfile
+from datetime import datetime
+
+CHECKPOINT_DIR = os.environ.get("CHECKPOINT_DIR", "/watch/input/.cache/jobs")
+
+TRANSCRIBED = "transcribed"
+NOTE_GENERATED = "note_generated"
+NOTE_WRITTEN = "note_written"
+ARCHIVED = "archived"
+STAGES = (TRANSCRIBED, NOTE_GENERATED, NOTE_WRITTEN, ARCHIVED)
+
+# Artifacts dropped once a job is archived — the note is in the vault by then
+_RESUME_ARTIFACTS = ("transcript", "markdown")
+
+
+def _record_path(content_hash):
+    return os.path.join(CHECKPOINT_DIR, f"{content_hash}.json")
+
+
+def load(content_hash):
+    """Return the checkpoint record for this audio, or a fresh one."""
+    try:
+        with open(_record_path(content_hash), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        print(f"[CHECKPOINT] Unreadable record for {content_hash[:12]} ({e}), starting fresh")
+    return {"content_hash": content_hash, "stages": {}}
+
+
+def save(record):
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=CHECKPOINT_DIR, prefix=".tmp-", suffix=".json")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(record, f)
+    os.replace(tmp_path, _record_path(record["content_hash"]))
+
+
+def done(record, stage):
+    return stage in record["stages"]
+
+
+def mark(record, stage, **artifacts):
+    """Record a completed stage plus any artifacts, and persist immediately."""
+    record["stages"][stage] = datetime.now().isoformat(timespec="seconds")
+    record.update(artifacts)
+    if stage == ARCHIVED:
+        for key in _RESUME_ARTIFACTS:
+            record.pop(key, None)
+    try:
+        save(record)
+    except OSError as e:
+        print(f"[CHECKPOINT] Failed to save {stage} ({e})")
+
+
+def resume_point(record):
+    """Name of the first incomplete stage, or None if the job is finished."""
+    for stage in STAGES:
+        if stage not in record["stages"]:
+            return stage
+    return None
@@ -0,0 +1,103 @@
+"""Shared API clients for pipeline.py and weekly_report.py.
+
+Each process keeps one Anthropic client and one keep-alive requests.Session
+for the Obsidian Local REST API, so connection setup is paid once instead
+of on every call. Pool sizes and timeouts are configured here.
+"""
+
+import os
+import json
+import threading
+
+import anthropic
+import requests
+from requests.adapters import HTTPAdapter
+
+# Anthropic — per-call read timeouts are passed to anthropic_client()
+CLAUDE_CONNECT_TIMEOUT_SECONDS = 10.0
+CLAUDE_WRITE_TIMEOUT_SECONDS = 30.0
+CLAUDE_POOL_TIMEOUT_SECONDS = 5.0
+CLAUDE_MAX_RETRIES = 2
+# Pre-flight token counts — "api" uses the token-counting endpoint,
+# "estimate" (or an API failure) falls back to CHARS_PER_TOKEN
+TOKEN_COUNTING = os.environ.get("TOKEN_COUNTING", "api").lower()
+CHARS_PER_TOKEN = 4
+
+# Obsidian Local REST API
+OBSIDIAN_TIMEOUT_SECONDS = 30   # 30 sec max for Obsidian API calls
+OBSIDIAN_POOL_SIZE = int(os.environ.get("OBSIDIAN_POOL_SIZE", "8"))
+
+_lock = threading.Lock()
+_anthropic = None
+_obsidian = None
+
+
+def claude_timeout(read_seconds):
+    return anthropic.Timeout(
+        connect=CLAUDE_CONNECT_TIMEOUT_SECONDS,
+        read=read_seconds,
+        write=CLAUDE_WRITE_TIMEOUT_SECONDS,
+        pool=CLAUDE_POOL_TIMEOUT_SECONDS,
+    )
+
+
+def anthropic_client(read_timeout=None):
+    """The process-wide Anthropic client.
+
+    With `read_timeout`, returns a view of it with that read timeout; the
+    view shares the same HTTP connection pool.
+    """
+    global _anthropic
+    with _lock:
+        if _anthropic is None:
+            _anthropic = anthropic.Anthropic(
+                api_key=os.environ["ANTHROPIC_API_KEY"],
+                timeout=claude_timeout(600.0),
+                max_retries=CLAUDE_MAX_RETRIES,
+            )
+    if read_timeout is None:
+        return _anthropic
+    return _anthropic.with_options(timeout=claude_timeout(read_timeout))
+
+
+def obsidian_session():
+    """The process-wide keep-alive session for the Obsidian REST API.
+
+    Carries the Authorization header; callers still pass per-request
+    timeouts (OBSIDIAN_TIMEOUT_SECONDS).
+    """
+    global _obsidian
+    with _lock:
+        if _obsidian is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=OBSIDIAN_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers["Authorization"] = f"Bearer {os.environ['OBSIDIAN_API_KEY']}"
+            _obsidian = session
+    return _obsidian
+
+
+def estimate_tokens(params):
+    """Rough input token count for a Messages request, from its size in characters."""
+    parts = [params.get("system", ""), params["messages"], params.get("tools", [])]
+    chars = sum(len(p) if isinstance(p, str) else len(json.dumps(p, default=str)) for p in parts)
+    return chars // CHARS_PER_TOKEN
+
+
+def count_input_tokens(params):
+    """Input tokens for a Messages request, before sending it.
+
+    Uses the token-counting endpoint, or the local estimate when
+    TOKEN_COUNTING=estimate, no API key is set, or the endpoint can't be
+    reached. The endpoint is tried once, without retries, since the
+    estimate is a fine answer. Returns (tokens, "api" or "estimate").
+    """
+    if TOKEN_COUNTING == "api" and os.environ.get("ANTHROPIC_API_KEY"):
+        request = {key: params[key] for key in ("model", "system", "messages", "tools") if key in params}
+        client = anthropic_client(read_timeout=30.0).with_options(max_retries=0)
+        try:
+            return client.messages.count_tokens(**request).input_tokens, "api"
+        except anthropic.APIError as e:
+            print(f"[CLAUDE] Token counting unavailable ({type(e).__name__}), estimating")
+    return estimate_tokens(params), "estimate"
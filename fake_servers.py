@@ -0,0 +1,411 @@
+"""Local stand-ins for the Anthropic API and the Obsidian Local REST API.
+
+They emulate only what pipeline.py and weekly_report.py use, so both can be
+run end to end, repeatably, with no network and no Obsidian:
+
+  Anthropic   POST /v1/messages (JSON or SSE streaming, tool_use turns)
+              POST /v1/messages/count_tokens
+              POST /v1/messages/batches, GET .../{id}, GET .../{id}/results
+              GET  /stats  (request and token totals, for throughput tests)
+  Obsidian    GET /vault/{folder}/, GET/PUT/DELETE /vault/{path}
+              backed by a directory on disk
+
+Replies are deterministic placeholder notes. Tokens are counted as
+characters / 4. `latency` delays every response, and `tokens_per_second`
+paces generated output, so streaming timeouts and time-to-first-token can
+be measured realistically.
+
+Point the pipeline at them with ANTHROPIC_BASE_URL and OBSIDIAN_BASE_URL:
+
+    python fake_servers.py --vault /tmp/vault
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8089 OBSIDIAN_BASE_URL=http://127.0.0.1:27199 \\
+        ANTHROPIC_API_KEY=fake OBSIDIAN_API_KEY=fake python backlog.py --keep samples/
+"""
+
+import os
+import re
+import json
+import time
+import shutil
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+CHARS_PER_TOKEN = 4
+
+
+def _tokens(value):
+    text = value if isinstance(value, str) else json.dumps(value)
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send(self, status, body=b"", content_type="application/json"):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode("utf-8")
+        elif isinstance(body, str):
+            body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+# ---------------------------------------------------------------------------
+# Anthropic
+# ---------------------------------------------------------------------------
+def _text_of(content):
+    if isinstance(content, str):
+        return content
+    return "\n".join(block.get("text", "") for block in content if isinstance(block, dict))
+
+
+def _tool_results(messages):
+    """Names of the tools whose results are already in the conversation."""
+    called = {}
+    for message in messages:
+        if message["role"] == "assistant" and isinstance(message["content"], list):
+            for block in message["content"]:
+                if block.get("type") == "tool_use":
+                    called[block["id"]] = block["name"]
+    done = set()
+    for message in messages:
+        if message["role"] == "user" and isinstance(message["content"], list):
+            for block in message["content"]:
+                if block.get("type") == "tool_result":
+                    done.add(called.get(block["tool_use_id"]))
+    return done
+
+
+def _placeholder_note(prompt, output_tokens):
+    """A note-shaped markdown reply about the recording named in the prompt."""
+    match = re.search(r"^Audio file: (.+)$", prompt, re.M)
+    name = os.path.splitext(match.group(1).strip())[0] if match else "recording"
+    words = re.findall(r"[A-Za-z]{4,}", prompt.split("Transcript:", 1)[-1])[:40]
+    links = re.findall(r"\[\[[^\]]+\]\]", prompt)[:2]
+    note = (
+        f"---\nsource: {name}\ngenerated: fake-anthropic\ntags: [fake]\n---\n\n"
+        f"## Summary\n\nPlaceholder summary of {name}.\n\n"
+        f"## Key Points\n\n- {' '.join(words[:12]) or 'No speech'}\n\n"
+        f"## Action Items\n\n- [ ] Review {name}\n"
+    )
+    if links:
+        note += f"\n## Related\n\n" + "\n".join(f"- {link}" for link in links) + "\n"
+    filler = " ".join(words) or "placeholder"
+    while _tokens(note) < output_tokens:
+        note += f"\n- {filler}"
+    return note
+
+
+def _reply(request, output_tokens):
+    """Build the assistant content blocks and stop reason for a request."""
+    messages = request["messages"]
+    prompt = _text_of(messages[0]["content"])
+    tools = {tool["name"] for tool in request.get("tools", [])}
+    done = _tool_results(messages)
+    if "obsidian_list_notes" in tools and "obsidian_list_notes" not in done:
+        return [{
+            "type": "tool_use", "id": f"toolu_{time.monotonic_ns()}", "name": "obsidian_list_notes",
+            "input": {"folder": "Audio Summaries"},
+        }], "tool_use"
+    if "obsidian_create_note" in tools and "obsidian_create_note" not in done:
+        match = re.search(r"^Note path: (.+)$", prompt, re.M)
+        path = match.group(1).strip() if match else "Audio Summaries/fake.md"
+        content = _placeholder_note(prompt, output_tokens) + "\n## Transcript\n\n" + prompt.split("Transcript:", 1)[-1].strip()
+        return [{
+            "type": "tool_use", "id": f"toolu_{time.monotonic_ns()}", "name": "obsidian_create_note",
+            "input": {"path": path, "content": content},
+        }], "tool_use"
+    if tools:
+        return [{"type": "text", "text": "Note created."}], "end_turn"
+    if request.get("system") and "condense one part" in _text_of(request["system"]):
+        words = re.findall(r"[A-Za-z]{4,}", prompt)[:30]
+        return [{"type": "text", "text": f"- Part covering: {' '.join(words)}"}], "end_turn"
+    return [{"type": "text", "text": _placeholder_note(prompt, output_tokens)}], "end_turn"
+
+
+class FakeAnthropicHandler(_Handler):
+    def do_GET(self):
+        server = self.server
+        if self.path == "/stats":
+            with server.lock:
+                return self._send(200, dict(server.stats))
+        match = re.fullmatch(r"/v1/messages/batches/([\w-]+)(/results)?", self.path)
+        if not match:
+            return self._send(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+        batch = server.batches.get(match.group(1))
+        if batch is None:
+            return self._send(404, {"type": "error", "error": {"type": "not_found_error", "message": "batch"}})
+        if not match.group(2):
+            return self._send(200, server.batch_object(batch))
+        lines = "".join(json.dumps(result) + "\n" for result in batch["results"])
+        return self._send(200, lines, "application/binary")
+
+    def do_POST(self):
+        server = self.server
+        request = json.loads(self._body() or b"{}")
+        time.sleep(server.latency)
+        if self.path == "/v1/messages/count_tokens":
+            return self._send(200, {"input_tokens": server.input_tokens(request)})
+        if self.path == "/v1/messages/batches":
+            return self._send(200, server.batch_object(server.create_batch(request["requests"])))
+        if self.path != "/v1/messages":
+            return self._send(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+        message = server.create_message(request)
+        if request.get("stream"):
+            return self._stream(message)
+        time.sleep(message["usage"]["output_tokens"] / server.tokens_per_second)
+        return self._send(200, message)
+
+    def _stream(self, message):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def event(name, data):
+            self.wfile.write(f"event: {name}\ndata: {json.dumps(data)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        start = dict(message, content=[], stop_reason=None,
+                     usage=dict(message["usage"], output_tokens=1))
+        event("message_start", {"type": "message_start", "message": start})
+        delay = 16 / CHARS_PER_TOKEN / self.server.tokens_per_second  # per 16-char piece
+        for index, block in enumerate(message["content"]):
+            if block["type"] == "text":
+                event("content_block_start", {"type": "content_block_start", "index": index,
+                                              "content_block": {"type": "text", "text": ""}})
+                text, delta_type, key = block["text"], "text_delta", "text"
+            else:
+                event("content_block_start", {"type": "content_block_start", "index": index,
+                                              "content_block": dict(block, input={})})
+                text, delta_type, key = json.dumps(block["input"]), "input_json_delta", "partial_json"
+            for i in range(0, len(text), 16):
+                time.sleep(delay)
+                event("content_block_delta", {"type": "content_block_delta", "index": index,
+                                              "delta": {"type": delta_type, key: text[i:i + 16]}})
+            event("content_block_stop", {"type": "content_block_stop", "index": index})
+        event("message_delta", {"type": "message_delta",
+                                "delta": {"stop_reason": message["stop_reason"], "stop_sequence": None},
+                                "usage": {"output_tokens": message["usage"]["output_tokens"]}})
+        event("message_stop", {"type": "message_stop"})
+
+
+class FakeAnthropicServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, tokens_per_second=500.0, output_tokens=400, verbose=False):
+        super().__init__(address, FakeAnthropicHandler)
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.batches = {}
+        self.stats = {"messages": 0, "count_tokens": 0, "batches": 0, "input_tokens": 0, "output_tokens": 0}
+
+    @property
+    def base_url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def input_tokens(self, request):
+        with self.lock:
+            self.stats["count_tokens"] += 1
+        return sum(_tokens(request.get(key, "")) for key in ("system", "messages", "tools") if key in request)
+
+    def create_message(self, request):
+        content, stop_reason = _reply(request, self.output_tokens)
+        output_tokens = min(request.get("max_tokens", 4096), _tokens(content))
+        input_tokens = sum(_tokens(request[key]) for key in ("system", "messages", "tools") if key in request)
+        with self.lock:
+            self.stats["messages"] += 1
+            self.stats["input_tokens"] += input_tokens
+            self.stats["output_tokens"] += output_tokens
+        return {
+            "id": f"msg_fake_{time.monotonic_ns()}",
+            "type": "message",
+            "role": "assistant",
+            "model": request.get("model", "fake"),
+            "content": content,
+            "stop_reason": stop_reason,
+            "stop_sequence": None,
+            "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                      "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0},
+        }
+
+    def create_batch(self, requests):
+        batch_id = f"msgbatch_fake_{time.monotonic_ns()}"
+        batch = {"id": batch_id, "created_at": _now(), "ended_at": None, "requests": requests, "results": []}
+        with self.lock:
+            self.batches[batch_id] = batch
+            self.stats["batches"] += 1
+
+        def run():
+            for request in requests:
+                message = self.create_message(request["params"])
+                time.sleep(message["usage"]["output_tokens"] / self.tokens_per_second)
+                batch["results"].append({"custom_id": request["custom_id"],
+                                         "result": {"type": "succeeded", "message": message}})
+            batch["ended_at"] = _now()
+
+        threading.Thread(target=run, daemon=True).start()
+        return batch
+
+    def batch_object(self, batch):
+        ended = batch["ended_at"] is not None
+        done = len(batch["results"])
+        return {
+            "id": batch["id"],
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {"processing": len(batch["requests"]) - done, "succeeded": done,
+                               "errored": 0, "canceled": 0, "expired": 0},
+            "created_at": batch["created_at"],
+            "ended_at": batch["ended_at"],
+            "expires_at": (datetime.now(timezone.utc) + timedelta(days=1)).isoformat().replace("+00:00", "Z"),
+            "archived_at": None,
+            "cancel_initiated_at": None,
+            "results_url": f"{self.base_url}/v1/messages/batches/{batch['id']}/results" if ended else None,
+        }
+
+
+# ---------------------------------------------------------------------------
+# Obsidian Local REST API
+# ---------------------------------------------------------------------------
+class FakeObsidianHandler(_Handler):
+    def _vault_path(self):
+        if not self.path.startswith("/vault/"):
+            return None
+        relative = unquote(self.path[len("/vault/"):])
+        root = os.path.realpath(self.server.vault_dir)
+        full = os.path.realpath(os.path.join(root, relative))
+        if os.path.commonpath([full, root]) != root:
+            return None
+        return relative, full
+
+    def _resolve(self):
+        time.sleep(self.server.latency)
+        target = self._vault_path()
+        if target is None:
+            self._send(404, {"errorCode": 40400, "message": "Not Found"})
+        return target
+
+    def do_GET(self):
+        target = self._resolve()
+        if target is None:
+            return
+        relative, full = target
+        if relative.endswith("/") or relative == "":
+            if not os.path.isdir(full):
+                return self._send(404, {"errorCode": 40400, "message": "Not Found"})
+            files = sorted(
+                name + "/" if os.path.isdir(os.path.join(full, name)) else name
+                for name in os.listdir(full) if not name.startswith(".")
+            )
+            return self._send(200, {"files": files})
+        if not os.path.isfile(full):
+            return self._send(404, {"errorCode": 40400, "message": "Not Found"})
+        with open(full, "rb") as f:
+            return self._send(200, f.read(), "text/markdown; charset=utf-8")
+
+    def do_PUT(self):
+        target = self._resolve()
+        if target is None:
+            return
+        _, full = target
+        body = self._body()
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        with open(full, "wb") as f:
+            f.write(body)
+        self._send(204)
+
+    def do_DELETE(self):
+        target = self._resolve()
+        if target is None:
+            return
+        _, full = target
+        if not os.path.isfile(full):
+            return self._send(404, {"errorCode": 40400, "message": "Not Found"})
+        os.remove(full)
+        self._send(204)
+
+
+class FakeObsidianServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, vault_dir, latency=0.0, verbose=False):
+        super().__init__(address, FakeObsidianHandler)
+        self.vault_dir = vault_dir
+        self.latency = latency
+        self.verbose = verbose
+
+    @property
+    def base_url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+
+def start(server):
+    """Serve in a daemon thread and return the server (call .shutdown() to stop)."""
+    threading.Thread(target=server.serve_forever, name=type(server).__name__, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run fake Anthropic and Obsidian servers.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--anthropic-port", type=int, default=8089)
+    parser.add_argument("--obsidian-port", type=int, default=27199)
+    parser.add_argument("--vault", default=None, help="vault directory (default: a fresh temp dir)")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before every response")
+    parser.add_argument("--tokens-per-second", type=float, default=500.0, help="generated output rate")
+    parser.add_argument("--output-tokens", type=int, default=400, help="size of generated notes")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args()
+
+    vault = args.vault
+    cleanup = vault is None
+    if cleanup:
+        import tempfile
+        vault = tempfile.mkdtemp(prefix="fake-vault-")
+    os.makedirs(os.path.join(vault, "Audio Summaries"), exist_ok=True)
+
+    anthropic_server = start(FakeAnthropicServer(
+        (args.host, args.anthropic_port), args.latency, args.tokens_per_second, args.output_tokens, args.verbose
+    ))
+    obsidian_server = start(FakeObsidianServer((args.host, args.obsidian_port), vault, args.latency, args.verbose))
+    print(f"ANTHROPIC_BASE_URL={anthropic_server.base_url}")
+    print(f"OBSIDIAN_BASE_URL={obsidian_server.base_url}")
+    print(f"Vault: {vault}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        anthropic_server.shutdown()
+        obsidian_server.shutdown()
+        if cleanup:
+            shutil.rmtree(vault, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
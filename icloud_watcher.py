@@ -1,100 +1,240 @@
 import time
 import os
+import heapq
 import shutil
+import threading
 import subprocess
+import collections
+import concurrent.futures
+
+import job_store
+from transcript_cache import file_sha256
 
 ICLOUD_DIR = os.path.expanduser(
     "~/Library/Mobile Documents/com~apple~CloudDocs/AudioInbox"
 )
 LOCAL_DIR = os.path.expanduser("~/AudioProcessing")
+# On the Mac's own disk, never in the folder shared with Docker; the container keeps its own store
+JOB_STORE_PATH = os.environ.get(
+    "JOB_STORE_PATH", os.path.expanduser("~/audio-pipeline/.pipeline/jobs.sqlite")
+)
+# Replaced by the job store; imported once on first start
 PROCESSED_LOG = os.path.expanduser("~/audio-pipeline/processed_files.log")
 SUPPORTED = {".mp3", ".m4a", ".wav", ".ogg", ".flac"}
+JOB_SOURCE = "icloud"
+# Download manager — see DownloadManager
+DOWNLOAD_CONCURRENCY = int(os.environ.get("ICLOUD_DOWNLOAD_CONCURRENCY", "8"))
+HANDOFF_WORKERS = 2
+SCAN_SECONDS = 5                # how often the iCloud folder is listed
+POLL_SECONDS = 1                # how often downloading files are checked
+STABLE_SECONDS = 3              # a downloaded file's size must hold this long
+DOWNLOAD_TIMEOUT_SECONDS = 180
+RETRY_BACKOFF_SECONDS = 30      # first retry after a timeout, doubling each time
+RETRY_BACKOFF_MAX_SECONDS = 15 * 60
 
 os.makedirs(LOCAL_DIR, exist_ok=True)
 os.makedirs(ICLOUD_DIR, exist_ok=True)
 
-def load_processed():
-    """Load the list of already processed files from disk."""
-    if not os.path.exists(PROCESSED_LOG):
-        return set()
-    with open(PROCESSED_LOG, "r") as f:
-        return set(line.strip() for line in f if line.strip())
+def partial_path(dst):
+    """Hidden name a file is written under before it is renamed to dst."""
+    return os.path.join(os.path.dirname(dst), f".{os.path.basename(dst)}.partial")
 
-def mark_processed(fname):
-    """Save a filename to the processed log so it survives restarts."""
-    with open(PROCESSED_LOG, "a") as f:
-        f.write(fname + "\n")
+def move_into_place(src, dst):
+    """Move src to dst so that dst only ever appears complete.
 
-def is_fully_downloaded(path):
-    """Check if iCloud has fully downloaded the file."""
+    The data first lands under a hidden name beside dst, by the cheapest
+    means available: a rename when both are on the same volume (no bytes
+    copied), otherwise an APFS clone (`cp -c`), otherwise a kernel-level
+    copy (shutil.copy2). A final rename inside LOCAL_DIR then publishes the
+    file, which the container watcher treats as ready at once. src is only
+    removed after that rename. Returns the method used.
+    """
+    tmp = partial_path(dst)
     try:
-        size1 = os.path.getsize(path)
-        if size1 == 0:
-            return False
-        time.sleep(3)
-        size2 = os.path.getsize(path)
-        if size1 != size2:
-            return False
-        with open(path, "rb") as f:
-            f.read(1024)
-        return True
-    except (OSError, IOError):
-        return False
-
-def already_handled(fname, processed):
-    """Check if file has already been copied or processed."""
-    if fname in processed:
-        return True
-    if os.path.exists(os.path.join(LOCAL_DIR, fname)):
-        return True
-    return False
-
-# Load previously processed files on startup
-processed = load_processed()
-print(f"[ICLOUD WATCHER] Started. {len(processed)} files already processed.")
-print(f"[ICLOUD WATCHER] Monitoring: {ICLOUD_DIR}")
+        os.rename(src, tmp)
+        method = "rename"
+    except FileNotFoundError:
+        raise
+    except OSError:
+        try:
+            if subprocess.run(["cp", "-c", "-p", src, tmp], capture_output=True).returncode == 0:
+                method = "clone"
+            else:
+                shutil.copy2(src, tmp)
+                method = "copy"
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+    os.rename(tmp, dst)
+    if method != "rename":
+        os.remove(src)
+    return method
 
-while True:
+def recover_partials():
+    """Finish or discard hand-offs cut short by a previous run.
+
+    A .partial file whose source is still in iCloud was an unfinished clone
+    or copy, so it is deleted and the source handed off again. One whose
+    source is gone was renamed out of iCloud whole, so it is published.
+    """
+    for name in os.listdir(LOCAL_DIR):
+        if not (name.startswith(".") and name.endswith(".partial")):
+            continue
+        fname = name[1:-len(".partial")]
+        tmp = os.path.join(LOCAL_DIR, name)
+        dst = os.path.join(LOCAL_DIR, fname)
+        if os.path.exists(os.path.join(ICLOUD_DIR, fname)) or os.path.exists(dst):
+            os.remove(tmp)
+            print(f"[RECOVERED] Removed unfinished copy of {fname}")
+            continue
+        os.rename(tmp, dst)
+        store.claim(file_sha256(dst), dst, JOB_SOURCE, status=job_store.HANDED_OFF, blocked_by=())
+        print(f"[RECOVERED] {fname} → ~/AudioProcessing")
+
+_handing_off = set()  # content hashes being moved right now
+_handing_off_lock = threading.Lock()
+
+def hand_off(src, fname):
+    """Move a downloaded file into LOCAL_DIR unless the same recording was already handed off.
+
+    The hand-off is recorded only once the file is in place, so a run
+    killed mid-move leaves no record and the file is simply handed off
+    again on the next start.
+    """
+    dst = os.path.join(LOCAL_DIR, fname)
+    content_hash = file_sha256(src)
+    latest = store.latest(content_hash)
+    if latest is not None and latest["status"] == job_store.HANDED_OFF:
+        if latest["path"] != dst or os.path.exists(dst):
+            os.remove(src)
+            print(f"[DUPLICATE] {fname} — same recording as {latest['filename']} "
+                  f"(handed off), removed from inbox")
+            return
+        # Same name and content, already processed and archived: hand it off
+        # again and let the container's own job history decide
+    with _handing_off_lock:
+        if content_hash in _handing_off:
+            print(f"[WAITING] {fname} — same recording is being handed off, will check next scan")
+            return
+        _handing_off.add(content_hash)
     try:
-        files = os.listdir(ICLOUD_DIR)
-        for fname in files:
+        method = move_into_place(src, dst)
+    except OSError as e:
+        store.claim(content_hash, dst, JOB_SOURCE, status=job_store.FAILED, blocked_by=())
+        store.update(content_hash, dst, job_store.FAILED, error=str(e))
+        raise
+    else:
+        store.claim(content_hash, dst, JOB_SOURCE, status=job_store.HANDED_OFF, blocked_by=())
+    finally:
+        with _handing_off_lock:
+            _handing_off.discard(content_hash)
+    print(f"[MOVED] {fname} → ~/AudioProcessing ({method})")
+
+class DownloadManager:
+    """Download and hand off many iCloud files at once.
+
+    Every new file gets `brctl download` straight away, up to
+    DOWNLOAD_CONCURRENCY files in flight; the rest wait their turn. Each
+    file is checked on its own every POLL_SECONDS and is ready once it has
+    data on disk and its size has held for STABLE_SECONDS. Ready files are
+    handed off on a small worker pool, so one slow download never holds up
+    the others. A file not ready within DOWNLOAD_TIMEOUT_SECONDS goes to a
+    retry queue and is downloaded again after an exponential backoff.
+    """
+
+    def __init__(self):
+        self.tracked = set()                 # every file in one of the states below
+        self.waiting = collections.deque()   # (fname, attempt) not yet downloading
+        self.active = {}                     # fname -> download state
+        self.retries = []                    # heap of (due, fname, attempt)
+        self.handoffs = concurrent.futures.ThreadPoolExecutor(max_workers=HANDOFF_WORKERS)
+
+    def scan(self):
+        """Queue audio files that appeared in the iCloud folder."""
+        for fname in sorted(os.listdir(ICLOUD_DIR)):
             # Skip hidden files and non-audio files
             if fname.startswith("."):
                 continue
             ext = os.path.splitext(fname)[1].lower()
-            if ext not in SUPPORTED:
+            if ext not in SUPPORTED or fname in self.tracked:
                 continue
-
-            # Skip files already handled
-            if already_handled(fname, processed):
+            # Skip files already copied and waiting in the local inbox
+            if os.path.exists(os.path.join(LOCAL_DIR, fname)):
                 continue
-
-            src = os.path.join(ICLOUD_DIR, fname)
             print(f"[FOUND] {fname} — forcing iCloud download...")
+            self.tracked.add(fname)
+            self.waiting.append((fname, 1))
 
-            # Force iCloud to download the file
-            subprocess.run(["brctl", "download", src], capture_output=True)
-
-            # Wait up to ~3 minutes for file to be fully available (24 × ~8s per attempt)
-            ready = False
-            for attempt in range(24):
-                if is_fully_downloaded(src):
-                    ready = True
-                    break
-                print(f"[WAITING] {fname} — attempt {attempt + 1}/24")
-                time.sleep(5)
-
-            if ready:
-                dst = os.path.join(LOCAL_DIR, fname)
-                shutil.copy2(src, dst)
-                os.remove(src)
-                processed.add(fname)
-                mark_processed(fname)
-                print(f"[MOVED] {fname} → ~/AudioProcessing")
-            else:
-                print(f"[TIMEOUT] {fname} — will retry next cycle")
+    def poll(self, now):
+        while self.retries and self.retries[0][0] <= now:
+            _, fname, attempt = heapq.heappop(self.retries)
+            self.waiting.append((fname, attempt))
+        while self.waiting and len(self.active) < DOWNLOAD_CONCURRENCY:
+            self._start(*self.waiting.popleft(), now)
+        for fname, state in list(self.active.items()):
+            self._check(fname, state, now)
+
+    def _start(self, fname, attempt, now):
+        src = os.path.join(ICLOUD_DIR, fname)
+        # Force iCloud to download the file; progress is checked in _check
+        process = subprocess.Popen(["brctl", "download", src],
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.active[fname] = {
+            "src": src, "attempt": attempt, "process": process, "size": None,
+            "since": now, "deadline": now + DOWNLOAD_TIMEOUT_SECONDS,
+        }
+
+    def _check(self, fname, state, now):
+        state["process"].poll()  # reap brctl once it exits
+        try:
+            st = os.stat(state["src"])
+        except FileNotFoundError:
+            print(f"[GONE] {fname} — removed from iCloud before it was handed off")
+            del self.active[fname]
+            self.tracked.discard(fname)
+            return
+        # A file iCloud has not materialised yet reports its full size but has no blocks
+        size = st.st_size if st.st_blocks else 0
+        if size != state["size"]:
+            state["size"], state["since"] = size, now
+        elif size and now - state["since"] >= STABLE_SECONDS:
+            del self.active[fname]
+            self.handoffs.submit(self._hand_off, fname, state["src"])
+            return
+        if now > state["deadline"]:
+            del self.active[fname]
+            delay = min(RETRY_BACKOFF_MAX_SECONDS, RETRY_BACKOFF_SECONDS * 2 ** (state["attempt"] - 1))
+            heapq.heappush(self.retries, (now + delay, fname, state["attempt"] + 1))
+            print(f"[TIMEOUT] {fname} — not downloaded after {DOWNLOAD_TIMEOUT_SECONDS}s "
+                  f"(attempt {state['attempt']}), retrying in {delay}s")
 
+    def _hand_off(self, fname, src):
+        try:
+            hand_off(src, fname)
+        except Exception as e:
+            print(f"[ERROR] {fname}: {e} — will retry next scan")
+        finally:
+            self.tracked.discard(fname)
+
+store = job_store.JobStore(JOB_STORE_PATH)
+migrated = store.import_log(PROCESSED_LOG, LOCAL_DIR)
+if migrated:
+    print(f"[ICLOUD WATCHER] Imported {migrated} entries from {PROCESSED_LOG}")
+recover_partials()
+print(f"[ICLOUD WATCHER] Started. Job store: {JOB_STORE_PATH} {store.counts()}")
+print(f"[ICLOUD WATCHER] Monitoring: {ICLOUD_DIR}")
+
+manager = DownloadManager()
+last_scan = 0
+while True:
+    now = time.monotonic()
+    try:
+        if now - last_scan >= SCAN_SECONDS:
+            last_scan = now
+            manager.scan()
+        manager.poll(now)
     except Exception as e:
         print(f"[ERROR] {e}")
 
-    time.sleep(15)
+    time.sleep(POLL_SECONDS)
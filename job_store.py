@@ -0,0 +1,175 @@
+"""Persistent job history for watcher.py and icloud_watcher.py.
+
+One SQLite row per (content hash, path) records where a recording is in
+its life: handed off from iCloud, queued, processing, done or failed,
+with timestamps, attempt count, the last error and per-stage durations.
+Keying on content rather than filename means two Plaud recordings with the
+same name never collide, and a re-dropped file that was already processed
+is recognised after a restart. Lookups go through indexes, so startup cost
+does not grow with history.
+
+Each process keeps its own database, and neither is ever opened from the
+other side of the Docker Desktop file share: SQLite's locking, and WAL's
+shared-memory index, only work reliably within one kernel. The container
+stores its jobs in a Docker volume (JOB_STORE_PATH, default
+/var/lib/audio-pipeline/jobs.sqlite); icloud_watcher.py keeps its
+hand-offs on the Mac's own disk. WAL mode lets readers and a writer
+proceed together within each process.
+"""
+
+import os
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+JOB_STORE_PATH = os.environ.get("JOB_STORE_PATH", "/var/lib/audio-pipeline/jobs.sqlite")
+JOB_STORE_JOURNAL_MODE = os.environ.get("JOB_STORE_JOURNAL_MODE", "WAL")
+
+HANDED_OFF = "handed_off"   # copied into the inbox by icloud_watcher
+QUEUED = "queued"
+PROCESSING = "processing"
+DONE = "done"
+FAILED = "failed"
+INTERRUPTED = "interrupted"  # was queued or processing when the watcher stopped
+
+# A new claim on a recording is refused while its latest job is in one of these
+ACTIVE = (QUEUED, PROCESSING, DONE)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    content_hash TEXT,
+    path TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    source TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    error TEXT,
+    stage_seconds TEXT,
+    UNIQUE (content_hash, path)
+);
+CREATE INDEX IF NOT EXISTS jobs_hash ON jobs (content_hash, updated_at);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (source, status);
+"""
+
+
+def _now():
+    return datetime.now().isoformat(timespec="microseconds")
+
+
+class JobStore:
+    def __init__(self, path=JOB_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30)
+        try:
+            conn.execute(f"PRAGMA journal_mode={JOB_STORE_JOURNAL_MODE}")
+            conn.executescript(_SCHEMA)
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _connect(self):
+        """A short-lived connection; the block runs in one immediate transaction."""
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            with self._lock:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    yield conn
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+        finally:
+            conn.close()
+
+    def latest(self, content_hash):
+        """The most recently updated job for a recording, as a dict, or None."""
+        with self._connect() as conn:
+            row = self._latest(conn, content_hash)
+        return dict(row) if row else None
+
+    def _latest(self, conn, content_hash):
+        return conn.execute(
+            "SELECT * FROM jobs WHERE content_hash = ? ORDER BY updated_at DESC, id DESC LIMIT 1",
+            (content_hash,),
+        ).fetchone()
+
+    def claim(self, content_hash, path, source, status=QUEUED, blocked_by=ACTIVE):
+        """Atomically start a job for a recording.
+
+        Refused (returns False) if the recording's latest job is in one of
+        `blocked_by`. Otherwise the (content_hash, path) row is created, or
+        reused with its attempt count incremented, and True is returned.
+        """
+        now = _now()
+        with self._connect() as conn:
+            latest = self._latest(conn, content_hash)
+            if latest is not None and latest["status"] in blocked_by:
+                return False
+            conn.execute(
+                """INSERT INTO jobs (content_hash, path, filename, source, status, attempts, created_at, updated_at)
+                   VALUES (?, ?, ?, ?, ?, 1, ?, ?)
+                   ON CONFLICT (content_hash, path) DO UPDATE SET
+                       source = excluded.source, status = excluded.status, attempts = attempts + 1,
+                       updated_at = excluded.updated_at, error = NULL""",
+                (content_hash, path, os.path.basename(path), source, status, now, now),
+            )
+        return True
+
+    def update(self, content_hash, path, status, error=None, stage_seconds=None):
+        """Move a job to a new status, recording an error and stage durations if given."""
+        with self._connect() as conn:
+            conn.execute(
+                """UPDATE jobs SET status = ?, updated_at = ?, error = COALESCE(?, error),
+                       stage_seconds = COALESCE(?, stage_seconds)
+                   WHERE content_hash = ? AND path = ?""",
+                (status, _now(), error, json.dumps(stage_seconds) if stage_seconds else None,
+                 content_hash, path),
+            )
+
+    def requeue_interrupted(self, source):
+        """Mark `source`'s queued or processing jobs as interrupted so they can be claimed again.
+
+        Call once at startup, before anything is claimed: jobs left in those
+        states belong to a process that is no longer running.
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE source = ? AND status IN (?, ?)",
+                (INTERRUPTED, _now(), source, QUEUED, PROCESSING),
+            )
+        return cursor.rowcount
+
+    def import_log(self, log_path, directory):
+        """One-time migration of a plain-text processed-files log into the store.
+
+        Each filename becomes a done job with no content hash, kept for
+        history. The log is renamed to *.migrated so this runs once.
+        """
+        if not os.path.exists(log_path):
+            return 0
+        with open(log_path, "r") as f:
+            names = [line.strip() for line in f if line.strip()]
+        now = _now()
+        with self._connect() as conn:
+            conn.executemany(
+                """INSERT OR IGNORE INTO jobs (content_hash, path, filename, source, status, created_at, updated_at)
+                   VALUES (NULL, ?, ?, 'legacy-log', ?, ?, ?)""",
+                [(os.path.join(directory, name), name, DONE, now, now) for name in dict.fromkeys(names)],
+            )
+        os.replace(log_path, log_path + ".migrated")
+        return len(names)
+
+    def counts(self):
+        """{status: number of jobs}, for startup logging."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
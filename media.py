@@ -0,0 +1,22 @@
+"""Lightweight audio file helpers shared by pipeline.py and scheduler.py.
+
+Standard library only, so the watcher can use them before the pipeline
+(and its model dependencies) has been imported.
+"""
+
+import subprocess
+
+
+def probe_duration(file_path, timeout=30):
+    """Return the duration of an audio file in seconds via ffprobe, or None."""
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-show_entries", "format=duration",
+        "-of", "default=noprint_wrappers=1:nokey=1",
+        file_path,
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, check=True, text=True, timeout=timeout)
+        return float(result.stdout.strip())
+    except (subprocess.SubprocessError, OSError, ValueError):
+        return None
@@ -0,0 +1,163 @@
+"""Obsidian Local REST API client shared by pipeline.py and weekly_report.py.
+
+Every call goes through the pooled session from clients.obsidian_session().
+GET, PUT and DELETE are idempotent, so connection errors, responses cut
+off mid-body, timeouts and 429/5xx responses are retried with jittered
+exponential backoff; a brief Obsidian restart costs a few seconds instead
+of the run. Any other requests error fails just that call, as ObsidianError. Failures that
+outlast the retries raise ObsidianUnavailable, so callers can tell "Obsidian
+is down" apart from "the folder is empty" or "the note does not exist".
+The *_many helpers run one operation over many notes concurrently, up to
+OBSIDIAN_CONCURRENCY at a time.
+"""
+
+import os
+import time
+import random
+import concurrent.futures
+
+import requests
+
+from clients import OBSIDIAN_POOL_SIZE, OBSIDIAN_TIMEOUT_SECONDS, obsidian_session
+
+OBSIDIAN_RETRIES = int(os.environ.get("OBSIDIAN_RETRIES", "4"))  # retries after the first attempt
+OBSIDIAN_BACKOFF_SECONDS = 0.5      # first retry waits up to this long, doubling each time
+OBSIDIAN_BACKOFF_MAX_SECONDS = 8.0
+OBSIDIAN_CONCURRENCY = int(os.environ.get("OBSIDIAN_CONCURRENCY", str(OBSIDIAN_POOL_SIZE)))
+
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class ObsidianError(RuntimeError):
+    """Obsidian answered, but not with success. `status` is the HTTP status."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class ObsidianUnavailable(ObsidianError):
+    """Obsidian could not be reached, or kept failing, after every retry."""
+
+
+class ObsidianClient:
+    def __init__(self, base_url, retries=OBSIDIAN_RETRIES, concurrency=OBSIDIAN_CONCURRENCY):
+        self.base_url = base_url
+        self.retries = retries
+        self.concurrency = concurrency
+
+    def _request(self, method, path, **kwargs):
+        """Send one request, retrying transient failures. Returns the response.
+
+        Any status that is not retried is returned to the caller to interpret.
+        """
+        url = f"{self.base_url}/vault/{path}"
+        kwargs.setdefault("timeout", OBSIDIAN_TIMEOUT_SECONDS)
+        for attempt in range(self.retries + 1):
+            try:
+                response = obsidian_session().request(method, url, **kwargs)
+                if response.status_code not in _RETRY_STATUS:
+                    return response
+                problem = f"HTTP {response.status_code}"
+            except requests.exceptions.Timeout:
+                problem = "timeout"
+            except requests.exceptions.ConnectionError:
+                problem = "connection refused"
+            except requests.exceptions.ChunkedEncodingError:
+                problem = "response cut off"
+            except requests.exceptions.RequestException as e:
+                raise ObsidianError(f"Obsidian {method} {path} failed ({type(e).__name__}: {e})")
+            if attempt == self.retries:
+                break
+            delay = random.uniform(0, min(OBSIDIAN_BACKOFF_MAX_SECONDS, OBSIDIAN_BACKOFF_SECONDS * 2 ** attempt))
+            print(f"[OBSIDIAN] {method} {path} failed ({problem}), retry {attempt + 1}/{self.retries} in {delay:.1f}s")
+            time.sleep(delay)
+        raise ObsidianUnavailable(f"Obsidian {method} {path} failed after {self.retries + 1} attempts ({problem})")
+
+    def list(self, folder):
+        """Filenames in a vault folder; [] if the folder does not exist."""
+        response = self._request("GET", f"{folder}/", headers={"Accept": "application/json"})
+        if response.status_code == 404:
+            return []
+        if response.status_code != 200:
+            raise ObsidianError(f"Obsidian list of {folder} returned HTTP {response.status_code}",
+                                response.status_code)
+        try:
+            return response.json().get("files", [])
+        except ValueError:
+            raise ObsidianError(f"Obsidian list of {folder} returned invalid JSON", response.status_code)
+
+    def get(self, path):
+        """A note's markdown, or None if it does not exist."""
+        response = self._request("GET", path, headers={"Accept": "text/markdown"})
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise ObsidianError(f"Obsidian read of {path} returned HTTP {response.status_code}",
+                                response.status_code)
+        return response.text
+
+    def put(self, path, content):
+        """Create or overwrite a note. Returns the HTTP status."""
+        response = self._request(
+            "PUT", path, headers={"Content-Type": "text/markdown"}, data=content.encode("utf-8")
+        )
+        if response.status_code not in (200, 201, 204):
+            raise ObsidianError(f"Obsidian write of {path} returned HTTP {response.status_code}: "
+                                f"{response.text[:300]}", response.status_code)
+        return response.status_code
+
+    def delete(self, path):
+        """Delete a note. Returns False if it was already gone."""
+        response = self._request("DELETE", path)
+        if response.status_code == 404:
+            return False
+        if response.status_code not in (200, 204):
+            raise ObsidianError(f"Obsidian delete of {path} returned HTTP {response.status_code}",
+                                response.status_code)
+        return True
+
+    def move(self, src_path, dest_folder):
+        """Move a note by copying it to dest_folder and deleting the original.
+
+        Returns the destination path. Safe to repeat after a partial failure:
+        a source that is already gone but present at the destination counts
+        as moved.
+        """
+        dest_path = f"{dest_folder}/{os.path.basename(src_path)}"
+        content = self.get(src_path)
+        if content is None:
+            if self.get(dest_path) is not None:
+                return dest_path
+            raise ObsidianError(f"Cannot move {src_path}: note not found", 404)
+        self.put(dest_path, content)
+        self.delete(src_path)
+        return dest_path
+
+    def _run_many(self, func, items):
+        """Apply func to every item concurrently. Returns (results, failures) dicts."""
+        results, failures = {}, {}
+        if not items:
+            return results, failures
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.concurrency, len(items))) as executor:
+            futures = {executor.submit(func, item): item for item in items}
+            for future in concurrent.futures.as_completed(futures):
+                key = futures[future]
+                key = key[0] if isinstance(key, tuple) else key
+                try:
+                    results[key] = future.result()
+                except ObsidianError as e:
+                    failures[key] = e
+        return results, failures
+
+    def get_many(self, paths):
+        """Fetch many notes. Returns ({path: markdown or None}, {path: error})."""
+        return self._run_many(self.get, list(paths))
+
+    def put_many(self, notes):
+        """Write many (path, content) pairs. Returns ({path: status}, {path: error})."""
+        return self._run_many(lambda note: self.put(*note), list(notes))
+
+    def move_many(self, paths, dest_folder):
+        """Move many notes into dest_folder. Returns ({src: dest}, {src: error})."""
+        return self._run_many(lambda path: self.move(path, dest_folder), list(paths))
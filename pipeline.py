@@ -1,53 +1,220 @@
 import anthropic
-import whisper
+import httpx
 import os
+import re
 import json
 import tempfile
 import subprocess
 import numpy as np
-import torch
-import requests
 import threading
+import time
+import queue
+import multiprocessing
 import concurrent.futures
 from datetime import datetime
 import wave
-from silero_vad import load_silero_vad, get_speech_timestamps, collect_chunks
+from stages import Stage, StagedPipeline
+from clients import anthropic_client, count_input_tokens
+from obsidian import ObsidianClient, ObsidianError, ObsidianUnavailable
+from startup import report, timed
+from media import probe_duration
+from scheduler import strip_priority_marker
+import asr
+import checkpoints
+import transcript_cache
+import vault_index
+from asr import (
+    ASR_BACKEND, ASR_COMPUTE_TYPE, ASR_MODEL, SAMPLING_RATE,
+    CHUNK_MAX_SECONDS, SpanGrouper, TranscriptionWorker, WorkerTimeout, retained_from, transcribe_chunks,
+)
 
-print("Loading Whisper model...")
-whisper_model = whisper.load_model("base")
-
-print("Loading Silero VAD model...")
-vad_model = load_silero_vad()
-
-ANTHROPIC_API_KEY = os.environ["ANTHROPIC_API_KEY"]
-OBSIDIAN_API_KEY = os.environ["OBSIDIAN_API_KEY"]
 OBSIDIAN_HOST = os.environ.get("OBSIDIAN_HOST", "host.docker.internal")
 OBSIDIAN_PORT = os.environ.get("OBSIDIAN_PORT", "27123")
-OBSIDIAN_BASE_URL = f"http://{OBSIDIAN_HOST}:{OBSIDIAN_PORT}"
+OBSIDIAN_BASE_URL = os.environ.get("OBSIDIAN_BASE_URL", f"http://{OBSIDIAN_HOST}:{OBSIDIAN_PORT}")
 ARCHIVE_DIR = "/watch/input/processed"
+VAULT = ObsidianClient(OBSIDIAN_BASE_URL)
+
+DECODE_CHUNK_SECONDS = 30  # ffmpeg stdout is read in fixed chunks of this many seconds
+VAD_OPTIONS = {
+    "threshold": 0.5,
+    "min_speech_duration_ms": 250,
+    "min_silence_duration_ms": 200,
+    "speech_pad_ms": 200,
+}
+# Debug only: round-trip VAD output through a temp WAV instead of passing it in memory
+VAD_DEBUG_WAV = os.environ.get("VAD_DEBUG_WAV", "") == "1"
+
+# Long-audio mode — recordings at least this long are split on VAD boundaries
+# and transcribed in parallel, one Whisper model per worker process
+LONG_AUDIO_SECONDS = float(os.environ.get("LONG_AUDIO_SECONDS", "600"))
+LONG_AUDIO_WORKERS = int(os.environ.get("LONG_AUDIO_WORKERS", str(max(1, (os.cpu_count() or 1) // 2))))
+LONG_AUDIO_PREFETCH_CHUNKS = 2  # speech chunks VAD may run ahead of the transcription pool
 
 # Timeout settings — adjust these based on your audio file lengths
 WHISPER_TIMEOUT_SECONDS = 900   # 15 min max for transcription
-CLAUDE_TIMEOUT_SECONDS = 900    # 15 min max for Claude response (allow for large transcripts)
-OBSIDIAN_TIMEOUT_SECONDS = 30   # 30 sec max for Obsidian API calls
+# Claude responses are streamed; a call fails only if no chunk arrives for this
+# long, so slow but healthy generations of any length can finish
+CLAUDE_IDLE_TIMEOUT_SECONDS = float(os.environ.get("CLAUDE_IDLE_TIMEOUT_SECONDS", "120"))
+CLAUDE_PROGRESS_SECONDS = 15    # how often a running stream logs its progress
 
+# Note generation — "single" sends one tool-free request with the vault
+# listing prefetched; "tools" lets Claude list and write through tool calls
+NOTE_MODE = os.environ.get("NOTE_MODE", "single")
+NOTES_FOLDER = "Audio Summaries"
+VAULT_LISTING_TTL_SECONDS = float(os.environ.get("VAULT_LISTING_TTL_SECONDS", "120"))
+# Only this many related notes, ranked locally by vault_index, go into the prompt
+VAULT_INDEX_TOP_K = int(os.environ.get("VAULT_INDEX_TOP_K", "15"))
+
+# Map-reduce — prompts counted above this many input tokens are summarized in
+# sentence-aligned parts, several at a time, then reduced to one note
+MAP_REDUCE_THRESHOLD_TOKENS = int(os.environ.get("MAP_REDUCE_THRESHOLD_TOKENS", "25000"))
+MAP_CHUNK_CHARS = int(os.environ.get("MAP_CHUNK_CHARS", "40000"))
+MAP_REDUCE_PARALLELISM = int(os.environ.get("MAP_REDUCE_PARALLELISM", "4"))
+MAP_SUMMARY_MAX_TOKENS = 2000
+
+# Adaptive max_tokens — the expected note grows with the transcript; requests
+# get twice the expected size as headroom, within these bounds
+NOTE_BASE_TOKENS = 800          # frontmatter, summary and headings
+NOTE_TOKENS_PER_INPUT_TOKEN = 0.04
+NOTE_MIN_MAX_TOKENS = 4000
+NOTE_MAX_MAX_TOKENS = 16000
+CLAUDE_MAX_OUTPUT_TOKENS = 64000  # model limit; the tool loop writes the transcript back out
+
+# Load models in a background thread at startup instead of on the first file
+WARM_UP_MODELS = os.environ.get("WARM_UP_MODELS", "1") == "1"
+
+# Staged pipeline — worker threads per stage and bounded queue size between stages
+STAGE_WORKERS = {
+    "decode": int(os.environ.get("DECODE_WORKERS", "1")),
+    "transcribe": int(os.environ.get("TRANSCRIBE_WORKERS", "1")),
+    "note": int(os.environ.get("NOTE_WORKERS", "2")),
+    "archive": int(os.environ.get("ARCHIVE_WORKERS", "1")),
+}
+STAGE_QUEUE_SIZE = int(os.environ.get("STAGE_QUEUE_SIZE", "2"))
+
+
+# ---------------------------------------------------------------------------
+# Models — loaded lazily on first use, or ahead of time by warm_up()
+# ---------------------------------------------------------------------------
+# One warm ASR worker process per transcription stage worker
+_asr_workers = queue.Queue()
+for _n in range(STAGE_WORKERS["transcribe"]):
+    _asr_workers.put(TranscriptionWorker(f"asr-worker-{_n + 1}"))
+# Silero VAD keeps recurrent state inside the model, so each thread gets its own
+_vad_local = threading.local()
+
+
+def get_vad_model():
+    if getattr(_vad_local, "model", None) is None:
+        print("Loading Silero VAD model...")
+        with timed("import torch + silero_vad"):
+            from silero_vad import load_silero_vad
+        with timed("load Silero VAD"):
+            _vad_local.model = load_silero_vad()
+    return _vad_local.model
 
-def load_audio_16k(file_path):
-    """Load any audio format as a 16kHz mono float32 tensor via ffmpeg.
 
-    Bypasses torchaudio audio I/O (broken in torchaudio >= 2.9) by piping
-    raw PCM data directly from ffmpeg into a torch tensor.
+def warm_up(engine=None):
+    """Load the ASR models in a background thread, then print timings.
+
+    Silero VAD is per-thread, so it is warmed by the decode workers' init
+    hook (see build_staged_pipeline); pass the started `engine` to have the
+    timing report wait for those loads too.
+    """
+    def run():
+        try:
+            workers = list(_asr_workers.queue)
+            print(f"Loading ASR engine ({ASR_BACKEND}, {ASR_MODEL}, {ASR_COMPUTE_TYPE}) in {len(workers)} worker(s)...")
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.wait_ready()
+        except Exception as e:
+            print(f"[WARMUP] Model warm-up failed ({e}), models will load on first use")
+        if engine is not None:
+            engine.wait_initialized()
+        report()
+
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def _read_into(stream, buffer):
+    """Fill a float32 numpy buffer from a binary stream. Returns samples read."""
+    view = memoryview(buffer).cast("B")
+    filled = 0
+    while filled < len(view):
+        n = stream.readinto(view[filled:])
+        if not n:
+            break
+        filled += n
+    return filled // 4
+
+
+def stream_audio_16k(file_path, chunk_seconds=DECODE_CHUNK_SECONDS, ring_slots=2):
+    """Yield 16kHz mono float32 chunks from ffmpeg stdout as they are decoded.
+
+    Chunks are views into a preallocated ring buffer of `ring_slots` slots, so
+    peak memory stays at ring_slots * chunk_seconds of audio no matter how
+    long the recording is. A yielded chunk is only valid until the generator
+    wraps around to its slot again — copy it if you need to keep it longer.
     """
+    chunk_samples = int(chunk_seconds * SAMPLING_RATE)
+    ring = np.empty((ring_slots, chunk_samples), dtype=np.float32)
     cmd = [
-        "ffmpeg", "-y", "-i", file_path,
-        "-ar", "16000",   # resample to 16kHz
-        "-ac", "1",       # mono
-        "-f", "f32le",    # raw 32-bit float little-endian
-        "-"               # output to stdout
+        "ffmpeg", "-nostdin", "-v", "error", "-i", file_path,
+        "-ar", str(SAMPLING_RATE),  # resample to 16kHz
+        "-ac", "1",                 # mono
+        "-f", "f32le",              # raw 32-bit float little-endian
+        "-"                         # output to stdout
     ]
-    result = subprocess.run(cmd, capture_output=True, check=True)
-    audio = np.frombuffer(result.stdout, dtype=np.float32).copy()
-    return torch.from_numpy(audio)
+    with tempfile.TemporaryFile() as stderr:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr)
+        slot = 0
+        try:
+            while True:
+                n = _read_into(proc.stdout, ring[slot])
+                if n == 0:
+                    break
+                yield ring[slot, :n]
+                if n < chunk_samples:
+                    break
+                slot = (slot + 1) % ring_slots
+        finally:
+            proc.stdout.close()
+            if proc.poll() is None:
+                proc.kill()
+            proc.wait()
+        # Only reached when the stream was consumed to the end
+        if proc.returncode != 0:
+            stderr.seek(0)
+            raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=stderr.read()[-500:])
+
+
+def load_audio_16k(file_path):
+    """Load any audio format as a 16kHz mono float32 tensor via ffmpeg.
+
+    Bypasses torchaudio audio I/O (broken in torchaudio >= 2.9) by streaming
+    raw PCM data from ffmpeg into a single buffer sized from ffprobe's
+    duration, so the decoded audio is held in memory exactly once.
+    """
+    import torch
+
+    duration = probe_duration(file_path)
+    capacity = int((duration or 60) * SAMPLING_RATE) + SAMPLING_RATE
+    audio = np.empty(capacity, dtype=np.float32)
+    filled = 0
+    for chunk in stream_audio_16k(file_path):
+        end = filled + len(chunk)
+        if end > len(audio):
+            # Duration probe was short or unavailable — grow geometrically
+            grown = np.empty(max(end, 2 * len(audio)), dtype=np.float32)
+            grown[:filled] = audio[:filled]
+            audio = grown
+        audio[filled:end] = chunk
+        filled = end
+    return torch.from_numpy(audio[:filled])
 
 
 def save_audio_wav(path, audio_tensor, sampling_rate=16000):
@@ -63,44 +230,213 @@ def save_audio_wav(path, audio_tensor, sampling_rate=16000):
         wf.writeframes(audio_int16.tobytes())
 
 
+def stream_speech_chunks(file_path):
+    """Yield (offset_seconds, audio) speech chunks while ffmpeg is still decoding.
+
+    Decoded audio from stream_audio_16k is fed to Silero's VADIterator in
+    512-sample windows. Each speech segment is handed to a SpanGrouper as
+    soon as it closes, and every 30-60 second span it completes is yielded
+    straight away, so transcription can start on the first chunks before
+    the rest of the file is decoded. Only the audio an open span can still
+    need is kept in memory.
+    """
+    import torch
+    from silero_vad import VADIterator
+
+    window = 512
+    pad = int(VAD_OPTIONS["speech_pad_ms"] * SAMPLING_RATE / 1000)
+    min_speech = int(VAD_OPTIONS["min_speech_duration_ms"] * SAMPLING_RATE / 1000)
+    max_samples = int(CHUNK_MAX_SECONDS * SAMPLING_RATE)
+    vad = VADIterator(
+        get_vad_model(),
+        threshold=VAD_OPTIONS["threshold"],
+        sampling_rate=SAMPLING_RATE,
+        min_silence_duration_ms=VAD_OPTIONS["min_silence_duration_ms"],
+        speech_pad_ms=VAD_OPTIONS["speech_pad_ms"],
+    )
+    grouper = SpanGrouper()
+    buffer = np.empty(0, dtype=np.float32)
+    buffer_start = 0      # absolute sample index of buffer[0]
+    fed = 0               # samples already passed through VAD
+    speech_start = None   # start of the VAD segment currently open
+    chunks = 0
+
+    def cut(spans):
+        for start, end in spans:
+            yield start / SAMPLING_RATE, buffer[start - buffer_start:end - buffer_start].copy()
+
+    try:
+        for decoded in stream_audio_16k(file_path):
+            buffer = np.concatenate((buffer, decoded))
+            available = buffer_start + len(buffer)
+            while fed + window <= available:
+                offset = fed - buffer_start
+                event = vad(torch.from_numpy(buffer[offset:offset + window]))
+                fed += window
+                spans = []
+                if event and "end" in event and speech_start is not None:
+                    end = min(event["end"], available)
+                    if end - speech_start >= min_speech:
+                        spans = grouper.add(speech_start, end)
+                    speech_start = None
+                elif event and "start" in event:
+                    speech_start = event["start"]
+                elif speech_start is not None and fed - speech_start >= max_samples:
+                    # Long unbroken speech — hand over what we have so ASR can start
+                    spans = grouper.add(speech_start, fed)
+                    speech_start = fed
+                if speech_start is None:
+                    # A span that can no longer grow is cut now, not at the next speech
+                    spans += grouper.expire(fed)
+                for chunk in cut(spans):
+                    chunks += 1
+                    yield chunk
+
+            # Drop audio that no open segment or span can still reach
+            keep_from = retained_from(grouper.open_start, speech_start, fed - pad - window)
+            if keep_from > buffer_start:
+                buffer = buffer[keep_from - buffer_start:]
+                buffer_start = keep_from
+
+        end_of_audio = buffer_start + len(buffer)
+        spans = grouper.add(speech_start, end_of_audio) if speech_start is not None else []
+        for chunk in cut(spans + grouper.flush()):
+            chunks += 1
+            yield chunk
+        print(f"[VAD] Streaming VAD produced {chunks} chunks from {end_of_audio / SAMPLING_RATE / 60:.1f} min of audio")
+    finally:
+        vad.reset_states()
+
+
+def long_audio_chunks(file_path):
+    """stream_speech_chunks with the same fallbacks strip_silence has.
+
+    If VAD finds no speech, or fails before producing a chunk, the whole
+    recording is transcribed instead, still cut into CHUNK_MAX_SECONDS
+    pieces as it decodes so memory stays flat.
+    """
+    produced = 0
+    try:
+        for chunk in stream_speech_chunks(file_path):
+            produced += 1
+            yield chunk
+    except Exception as e:
+        if produced:
+            raise
+        print(f"[VAD] Failed ({e}), using full audio")
+    else:
+        if produced:
+            return
+        print("[VAD] No speech detected, using full audio")
+    offset = 0.0
+    for decoded in stream_audio_16k(file_path, chunk_seconds=CHUNK_MAX_SECONDS):
+        yield offset, decoded.copy()
+        offset += len(decoded) / SAMPLING_RATE
+
+
+class ChunkFeed:
+    """Bounded hand-over of long-audio chunks from VAD to the transcription pool.
+
+    feed() runs on the thread that owns the VAD model (a decode worker) and
+    blocks while LONG_AUDIO_PREFETCH_CHUNKS chunks are waiting; the pool
+    iterates the feed from its own thread. An error on the VAD side is
+    re-raised to the reader, and close() from either side ends both.
+    """
+
+    _END = object()
+
+    def __init__(self, size=LONG_AUDIO_PREFETCH_CHUNKS):
+        self._queue = queue.Queue(maxsize=size)
+        self._closed = threading.Event()
+
+    def feed(self, chunks):
+        """Pass every chunk of `chunks` to the reader, then the end (or the error that stopped it)."""
+        try:
+            for chunk in chunks:
+                if not self._put(chunk):
+                    return
+        except Exception as e:
+            self._put(e)
+        else:
+            self._put(self._END)
+        finally:
+            chunks.close()
+
+    def close(self):
+        self._closed.set()
+
+    def __iter__(self):
+        while not self._closed.is_set():
+            try:
+                item = self._queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            if item is self._END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def _put(self, item):
+        while not self._closed.is_set():
+            try:
+                self._queue.put(item, timeout=1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+
 def strip_silence(file_path):
     """Use Silero VAD to remove non-speech segments before transcription.
 
-    Returns (path, is_temp) where path is either the original file or a
-    cleaned temp WAV, and is_temp indicates whether the caller must delete it.
-    Falls back to the original file on any error.
+    Returns (audio, is_temp). Normally audio is the 16kHz float32 numpy array
+    of the speech segments, handed to Whisper in memory with no re-decode.
+    For recordings of LONG_AUDIO_SECONDS or more it is instead a lazy
+    iterator of (offset_seconds, array) chunks from long_audio_chunks, to
+    be run through a ChunkFeed on the thread that called strip_silence, so
+    decoding, VAD and parallel transcription overlap, VAD uses that
+    thread's model and memory stays flat however long the file is.
+    With VAD_DEBUG_WAV set, the speech audio is written to a temp WAV and its
+    path returned instead, and is_temp tells the caller to delete it.
+    Falls back to the original file path if decoding or VAD fails.
     """
-    SAMPLING_RATE = 16000
+    duration = probe_duration(file_path)
+    if duration and duration >= LONG_AUDIO_SECONDS:
+        print(f"[VAD] {duration / 60:.0f} min recording, streaming VAD into long-audio mode")
+        return long_audio_chunks(file_path), False
+
     try:
+        vad_model = get_vad_model()
+        from silero_vad import get_speech_timestamps, collect_chunks
+
         wav = load_audio_16k(file_path)
         speech_timestamps = get_speech_timestamps(
-            wav,
-            vad_model,
-            sampling_rate=SAMPLING_RATE,
-            threshold=0.5,
-            min_speech_duration_ms=250,
-            min_silence_duration_ms=200,
-            speech_pad_ms=200,
+            wav, vad_model, sampling_rate=SAMPLING_RATE, **VAD_OPTIONS
         )
 
         if not speech_timestamps:
-            print("[VAD] No speech detected, using original file")
-            return file_path, False
+            print("[VAD] No speech detected, using full audio")
+            return wav.numpy(), False
 
         total_samples = len(wav)
         speech_samples = sum(ts["end"] - ts["start"] for ts in speech_timestamps)
         kept_pct = 100.0 * speech_samples / total_samples
 
         if kept_pct > 95:
-            print(f"[VAD] Only {100 - kept_pct:.1f}% silence found, using original file")
-            return file_path, False
+            print(f"[VAD] Only {100 - kept_pct:.1f}% silence found, using full audio")
+            return wav.numpy(), False
 
         print(f"[VAD] Kept {kept_pct:.1f}% of audio ({len(speech_timestamps)} speech segments)")
         speech_audio = collect_chunks(speech_timestamps, wav)
+        if not VAD_DEBUG_WAV:
+            return speech_audio.numpy(), False
+
         tmp = tempfile.NamedTemporaryFile(suffix=".wav", delete=False)
         tmp_path = tmp.name
         tmp.close()
         save_audio_wav(tmp_path, speech_audio, SAMPLING_RATE)
+        print(f"[VAD] Debug WAV written: {tmp_path}")
         return tmp_path, True
 
     except Exception as e:
@@ -108,148 +444,344 @@ def strip_silence(file_path):
         return file_path, False
 
 
-def transcribe_audio(file_path):
-    """Run Whisper in a thread with a timeout so it can't hang forever."""
-    print(f"[TRANSCRIBING] {file_path}")
-
-    cleaned_path, is_temp = strip_silence(file_path)
-
-    def run_whisper():
-        try:
-            result = whisper_model.transcribe(
-                cleaned_path,
-                fp16=False,
-                temperature=0,
-                beam_size=1,
-                best_of=1,
-                condition_on_previous_text=False,
-                no_speech_threshold=0.8,
-                compression_ratio_threshold=2.4,
-            )
-            return result["text"]
-        finally:
-            if is_temp and os.path.exists(cleaned_path):
-                os.unlink(cleaned_path)
+def transcribe_cleaned(file_path, audio, is_temp):
+    """Run Whisper on VAD output in a killable worker process with a timeout.
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
-        future = executor.submit(run_whisper)
+    `audio` is a float32 array, a file path (see strip_silence) or a
+    ChunkFeed of a long recording's chunks.
+    """
+    if isinstance(audio, ChunkFeed):
         try:
-            transcript = future.result(timeout=WHISPER_TIMEOUT_SECONDS)
-            print(f"[TRANSCRIBING] Complete. Length: {len(transcript)} characters")
-            return transcript
-        except concurrent.futures.TimeoutError:
-            if is_temp and os.path.exists(cleaned_path):
-                os.unlink(cleaned_path)
+            transcript = transcribe_chunks(audio, LONG_AUDIO_WORKERS, WHISPER_TIMEOUT_SECONDS)["text"]
+        except multiprocessing.TimeoutError:
             print(f"[ERROR] Whisper timed out after {WHISPER_TIMEOUT_SECONDS} seconds")
             raise RuntimeError(f"Transcription timed out for {file_path}")
+        finally:
+            audio.close()
+        print(f"[TRANSCRIBING] Complete. Length: {len(transcript)} characters")
+        return transcript
+
+    worker = _asr_workers.get()
+    try:
+        transcript = worker.transcribe(audio, WHISPER_TIMEOUT_SECONDS)["text"]
+        print(f"[TRANSCRIBING] Complete. Length: {len(transcript)} characters")
+        return transcript
+    except WorkerTimeout:
+        print(f"[ERROR] Whisper timed out after {WHISPER_TIMEOUT_SECONDS} seconds, worker killed")
+        raise RuntimeError(f"Transcription timed out for {file_path}")
+    finally:
+        _asr_workers.put(worker)
+        if is_temp and os.path.exists(audio):
+            os.unlink(audio)
+
+
+def transcription_params():
+    """Every setting that affects the transcript of a given audio file."""
+    params = asr.transcription_params()
+    params["vad"] = VAD_OPTIONS
+    params["long_audio_seconds"] = LONG_AUDIO_SECONDS
+    return params
+
+
+def load_cached_transcript(job):
+    """Hash the job's audio and look its transcript up in the cache.
+
+    Sets job["content_hash"] (unless the watcher already hashed the file)
+    and job["cache_key"]; on a hit also sets job["transcript"] and returns True.
+    """
+    if "content_hash" not in job:
+        job["content_hash"] = transcript_cache.file_sha256(job["file_path"])
+    job["cache_key"] = transcript_cache.cache_key(job["content_hash"], transcription_params())
+    entry = transcript_cache.get(job["cache_key"])
+    if entry is None:
+        return False
+    job["transcript"] = entry["transcript"]
+    print(f"[CACHE] Transcript cache hit ({len(job['transcript'])} characters), skipping transcription")
+    return True
+
+
+def store_transcript(job):
+    transcript_cache.put(job["cache_key"], {
+        "transcript": job["transcript"],
+        "filename": job["filename"],
+        "created": datetime.now().isoformat(timespec="seconds"),
+    })
+
+
+_listing_cache = {}  # folder -> (fetched_at, [filenames])
+_listing_lock = threading.Lock()
+
+
+def list_vault_folder(folder):
+    """Return the filenames in a vault folder, cached for VAULT_LISTING_TTL_SECONDS.
+
+    Raises ObsidianError (ObsidianUnavailable if Obsidian is down) if the
+    folder can't be listed; a missing folder lists as empty.
+    """
+    with _listing_lock:
+        cached = _listing_cache.get(folder)
+        if cached and time.monotonic() - cached[0] < VAULT_LISTING_TTL_SECONDS:
+            return list(cached[1])
+    files = VAULT.list(folder)
+    print(f"[OBSIDIAN] list_notes → {len(files)} files | folder: {folder}")
+    with _listing_lock:
+        _listing_cache[folder] = (time.monotonic(), files)
+    return list(files)
+
+
+def remember_note(path):
+    """Add a freshly written note to the cached listing of its folder."""
+    folder, _, name = path.rpartition("/")
+    with _listing_lock:
+        cached = _listing_cache.get(folder)
+        if cached and name not in cached[1]:
+            cached[1].append(name)
+
+
+def related_notes(transcript):
+    """The VAULT_INDEX_TOP_K notes most related to a transcript, as prompt lines.
+
+    Refreshes the local index against the (TTL-cached) folder listing first,
+    which only fetches notes the index hasn't seen. Raises like
+    list_vault_folder if Obsidian can't be listed.
+    """
+    listing = list_vault_folder(NOTES_FOLDER)
+    vault_index.refresh(NOTES_FOLDER, listing, VAULT.get_many)
+    lines = []
+    for note in vault_index.related(transcript, NOTES_FOLDER, VAULT_INDEX_TOP_K):
+        details = [f"tags: {', '.join(note['tags'])}"] if note["tags"] else []
+        if note["headings"]:
+            details.append(f"sections: {'; '.join(note['headings'][:6])}")
+        lines.append(f"[[{note['title']}]]" + (f" ({' | '.join(details)})" if details else ""))
+    print(f"[INDEX] {len(lines)} related notes of {len(listing)} in {NOTES_FOLDER}")
+    return lines
+
+
+def write_note(path, content):
+    """PUT a note into the vault. Returns {"success", "status"} like the tool result.
+
+    Transient failures are already retried by the Obsidian client.
+    """
+    try:
+        status = VAULT.put(path, content)
+    except ObsidianUnavailable as e:
+        print(f"[ERROR] Cannot reach Obsidian. Is it open? ({e})")
+        return {"success": False, "error": "obsidian_unavailable"}
+    except ObsidianError as e:
+        print(f"[OBSIDIAN] create_note failed | path: {path} | {e}")
+        return {"success": False, "status": e.status}
+    print(f"[OBSIDIAN] create_note → HTTP {status} | path: {path}")
+    remember_note(path)
+    vault_index.upsert(path, content)
+    return {"success": True, "status": status}
+
+
+# ---------------------------------------------------------------------------
+# Note generation — the system prompts and tool schema are the same for every
+# file. Together they are a few hundred tokens, under the model's 1024-token
+# minimum for a cacheable prefix, so they carry no cache breakpoint of their
+# own; only the tool loop's transcript turn is cached (see
+# create_obsidian_note_via_mcp).
+# ---------------------------------------------------------------------------
+CLAUDE_MODEL = "claude-sonnet-4-6"
+
+NOTE_SYSTEM_PROMPT = """You are an Obsidian note manager. Create a structured note for the audio recording in the user's message.
+
+Instructions:
+1. List existing notes in "Audio Summaries" folder first
+2. Create the new note at the note path given with the transcript
+3. Include: YAML frontmatter, 2-3 sentence summary, key points, action items, [[wiki-links]] to related notes, full transcript at bottom
+4. Be concise and efficient — complete this in as few tool calls as possible"""
+
+NOTE_TOOLS = [
+    {
+        "name": "obsidian_create_note",
+        "description": "Create a new note in the Obsidian vault",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "path": {
+                    "type": "string",
+                    "description": "File path within vault e.g. Audio Summaries/my-note.md"
+                },
+                "content": {
+                    "type": "string",
+                    "description": "Full markdown content of the note"
+                }
+            },
+            "required": ["path", "content"]
+        }
+    },
+    {
+        "name": "obsidian_list_notes",
+        "description": "List existing notes in a vault folder",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "folder": {
+                    "type": "string",
+                    "description": "Folder path to list"
+                }
+            },
+            "required": ["folder"]
+        }
+    }
+]
+
+
+SINGLE_SHOT_SYSTEM_PROMPT = """You are an Obsidian note manager. Write a structured note for the audio recording in the user's message.
+
+Instructions:
+1. Include: YAML frontmatter, 2-3 sentence summary, key points, action items, [[wiki-links]] to related notes
+2. Only link to the related notes listed in the message, and only where they fit
+3. Do not include the transcript — it is appended to the note automatically
+4. Reply with the markdown note only: no preamble, no code fences"""
+
+MAP_SYSTEM_PROMPT = """You condense one part of a long audio transcript so a later step can write a single note for the whole recording.
 
+Write concise bullet points covering the topics discussed, decisions, action items (with owners and dates when stated), people, places and equipment mentioned, and any open issues. Keep names and numbers exact. Reply with the bullets only."""
 
-def create_obsidian_note_via_mcp(filename, transcript):
-    """Call Claude with explicit timeouts on every request."""
+MAX_TRANSCRIPT_CHARS = 100000
 
-    # Truncate very long transcripts as a safety guard
-    MAX_TRANSCRIPT_CHARS = 100000
+
+def truncate_for_prompt(transcript):
+    """Truncate very long transcripts as a safety guard."""
     if len(transcript) > MAX_TRANSCRIPT_CHARS:
         print(f"[WARNING] Transcript too long ({len(transcript)} chars), truncating to {MAX_TRANSCRIPT_CHARS}")
         transcript = transcript[:MAX_TRANSCRIPT_CHARS] + "\n\n[Transcript truncated due to length]"
+    return transcript
 
-    client = anthropic.Anthropic(
-        api_key=ANTHROPIC_API_KEY,
-        timeout=anthropic.Timeout(
-            connect=10.0,       # 10 seconds to connect
-            read=CLAUDE_TIMEOUT_SECONDS,
-            write=30.0,
-            pool=5.0
-        )
+
+def note_path_for(filename):
+    base_name = strip_priority_marker(os.path.splitext(filename)[0])
+    return f"{NOTES_FOLDER}/{datetime.now().strftime('%m-%d-%y')} - {base_name}.md"
+
+
+def strip_code_fence(text):
+    """Remove a ```markdown fence if the model wrapped its reply in one."""
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        if text.rstrip().endswith("```"):
+            text = text.rstrip()[:-3]
+    return text.strip()
+
+
+def log_usage(label, usage):
+    """Print token usage for one Claude call, including prompt cache traffic."""
+    print(
+        f"[CLAUDE] {label} tokens: input={usage.input_tokens} "
+        f"cache_write={getattr(usage, 'cache_creation_input_tokens', None) or 0} "
+        f"cache_read={getattr(usage, 'cache_read_input_tokens', None) or 0} "
+        f"output={usage.output_tokens}"
     )
 
+
+def stream_message(label, **params):
+    """Stream one Messages API call and return the final Message.
+
+    The read timeout is the idle gap: it restarts with every chunk received,
+    so there is no fixed deadline on the whole generation. Logs time to
+    first token and periodic progress. If the stream stalls, the partial
+    output received so far is reported and RuntimeError is raised.
+
+    A stall after the response has started surfaces from the stream
+    iterator as a raw httpx error rather than an SDK error, so both are
+    handled.
+    """
+    client = anthropic_client(CLAUDE_IDLE_TIMEOUT_SECONDS)
+    start = time.monotonic()
+    first_token = None
+    last_progress = start
+    partial = []  # text and tool-input JSON received so far
+    try:
+        with client.messages.stream(**params) as stream:
+            for event in stream:
+                if event.type != "content_block_delta":
+                    continue
+                now = time.monotonic()
+                if first_token is None:
+                    first_token = now - start
+                    print(f"[CLAUDE] {label}: first token after {first_token:.1f}s")
+                delta = event.delta
+                if delta.type == "text_delta":
+                    partial.append(delta.text)
+                elif delta.type == "input_json_delta":
+                    partial.append(delta.partial_json)
+                if now - last_progress >= CLAUDE_PROGRESS_SECONDS:
+                    last_progress = now
+                    print(f"[CLAUDE] {label}: {sum(map(len, partial))} chars after {now - start:.0f}s")
+            message = stream.get_final_message()
+    except (anthropic.APITimeoutError, httpx.TimeoutException):
+        received = sum(map(len, partial))
+        print(f"[ERROR] Claude stream for {label} idle for {CLAUDE_IDLE_TIMEOUT_SECONDS:.0f}s "
+              f"after {time.monotonic() - start:.0f}s with {received} chars received")
+        if received:
+            print(f"[ERROR] Partial output ends: {''.join(partial)[-200:]!r}")
+        raise RuntimeError("Claude API stream stalled")
+    except (anthropic.APIConnectionError, httpx.TransportError) as e:
+        print(f"[ERROR] Claude API connection error: {e}")
+        raise
+
+    elapsed = time.monotonic() - start
+    ttft = f"{first_token:.1f}s" if first_token is not None else "n/a"
+    print(f"[CLAUDE] {label}: done in {elapsed:.1f}s (first token {ttft}, "
+          f"{message.usage.output_tokens / max(elapsed - (first_token or 0), 1e-3):.0f} tokens/s)")
+    log_usage(label, message.usage)
+    return message
+
+
+def create_obsidian_note_via_mcp(filename, transcript, max_tokens=45000):
+    """Run Claude's tool loop, streaming every request with an idle-gap timeout.
+
+    Returns {"path", "content", "written"} for the note Claude created, so
+    the caller can checkpoint the markdown even if the vault write failed.
+    Raises RuntimeError if Claude finishes without creating a note.
+    """
+
+    transcript = truncate_for_prompt(transcript)
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    base_name = os.path.splitext(filename)[0]
-    note_title = f"{datetime.now().strftime('%m-%d-%y')} - {base_name}"
+    note_path = note_path_for(filename)
 
-    tools = [
-        {
-            "name": "obsidian_create_note",
-            "description": "Create a new note in the Obsidian vault",
-            "input_schema": {
-                "type": "object",
-                "properties": {
-                    "path": {
-                        "type": "string",
-                        "description": "File path within vault e.g. Audio Summaries/my-note.md"
-                    },
-                    "content": {
-                        "type": "string",
-                        "description": "Full markdown content of the note"
-                    }
-                },
-                "required": ["path", "content"]
-            }
-        },
-        {
-            "name": "obsidian_list_notes",
-            "description": "List existing notes in a vault folder",
-            "input_schema": {
-                "type": "object",
-                "properties": {
-                    "folder": {
-                        "type": "string",
-                        "description": "Folder path to list"
-                    }
-                },
-                "required": ["folder"]
-            }
-        }
-    ]
+    note = {}
 
     def handle_tool_call(tool_name, tool_input):
-        auth_header = {"Authorization": f"Bearer {OBSIDIAN_API_KEY}"}
-        try:
-            if tool_name == "obsidian_create_note":
-                response = requests.put(
-                    f"{OBSIDIAN_BASE_URL}/vault/{tool_input['path']}",
-                    headers={**auth_header, "Content-Type": "text/markdown"},
-                    data=tool_input["content"].encode("utf-8"),
-                    timeout=OBSIDIAN_TIMEOUT_SECONDS
-                )
-                success = response.status_code in [200, 201, 204]
-                print(f"[OBSIDIAN] create_note → HTTP {response.status_code} | path: {tool_input['path']}")
-                if not success:
-                    print(f"[OBSIDIAN] Error body: {response.text[:300]}")
-                return {"success": success, "status": response.status_code}
-
-            elif tool_name == "obsidian_list_notes":
-                response = requests.get(
-                    f"{OBSIDIAN_BASE_URL}/vault/{tool_input['folder']}/",
-                    headers={**auth_header, "Content-Type": "application/json"},
-                    timeout=OBSIDIAN_TIMEOUT_SECONDS
-                )
-                print(f"[OBSIDIAN] list_notes → HTTP {response.status_code} | folder: {tool_input['folder']}")
-                return response.json() if response.status_code == 200 else {"files": []}
-
-        except requests.exceptions.Timeout:
-            print(f"[ERROR] Obsidian API timed out on {tool_name}")
-            return {"error": "timeout", "files": []}
-        except requests.exceptions.ConnectionError:
-            print(f"[ERROR] Cannot connect to Obsidian. Is it open?")
-            return {"error": "connection_refused", "files": []}
+        if tool_name == "obsidian_create_note":
+            note.update(path=tool_input["path"], content=tool_input["content"])
+            result = write_note(tool_input["path"], tool_input["content"])
+            note["written"] = result["success"]
+            return result
+
+        elif tool_name == "obsidian_list_notes":
+            # An unreachable vault is reported as an error, not as an empty folder
+            try:
+                return {"files": list_vault_folder(tool_input["folder"])}
+            except ObsidianUnavailable as e:
+                print(f"[ERROR] Cannot reach Obsidian. Is it open? ({e})")
+                return {"error": "obsidian_unavailable"}
+            except ObsidianError as e:
+                print(f"[ERROR] Obsidian list failed: {e}")
+                return {"error": f"HTTP {e.status}"}
 
+    # The transcript turn ends in a cache breakpoint covering tools, system
+    # prompt and transcript, so every later tool-loop iteration reads them
+    # from the prompt cache instead of paying for the transcript again.
+    system = NOTE_SYSTEM_PROMPT
     messages = [
         {
             "role": "user",
-            "content": f"""You are an Obsidian note manager. Create a structured note for this audio recording.
-
-Audio file: {filename}
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"""Audio file: {filename}
 Recorded: {timestamp}
+Note path: {note_path}
 
 Transcript:
-{transcript}
-
-Instructions:
-1. List existing notes in "Audio Summaries" folder first
-2. Create a new note at: Audio Summaries/{note_title}.md
-3. Include: YAML frontmatter, 2-3 sentence summary, key points, action items, [[wiki-links]] to related notes, full transcript at bottom
-4. Be concise and efficient — complete this in as few tool calls as possible"""
+{transcript}""",
+                    "cache_control": {"type": "ephemeral"},
+                }
+            ]
         }
     ]
 
@@ -259,19 +791,14 @@ Instructions:
 
     while iteration < max_iterations:
         iteration += 1
-        try:
-            response = client.messages.create(
-                model="claude-sonnet-4-6",
-                max_tokens=45000,
-                tools=tools,
-                messages=messages
-            )
-        except anthropic.APITimeoutError:
-            print(f"[ERROR] Claude API timed out on iteration {iteration}")
-            raise RuntimeError("Claude API timed out")
-        except anthropic.APIConnectionError as e:
-            print(f"[ERROR] Claude API connection error: {e}")
-            raise
+        response = stream_message(
+            f"iteration {iteration}",
+            model=CLAUDE_MODEL,
+            max_tokens=max_tokens,
+            system=system,
+            tools=NOTE_TOOLS,
+            messages=messages
+        )
 
         if response.stop_reason == "end_turn":
             print("[CLAUDE] Note creation complete.")
@@ -294,6 +821,190 @@ Instructions:
             print(f"[WARNING] Unexpected stop reason: {response.stop_reason}")
             break
 
+    if not note:
+        raise RuntimeError("Claude finished without creating a note")
+    return note
+
+
+def single_shot_request(filename, transcript, related, section_summaries=None, max_tokens=8000):
+    """Messages API parameters for a tool-free note request.
+
+    With `section_summaries` (the map step of map-reduce) the note is built
+    from those instead of the transcript. Shared by the synchronous path and
+    the batch backlog mode, so both send the same prompt. The
+    transcript is sent whole; plan_note() decides whether it fits.
+    """
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    listing = "\n".join(f"- {line}" for line in related) or "(none)"
+    if section_summaries is None:
+        source = f"Transcript:\n{transcript}"
+    else:
+        parts = "\n\n".join(
+            f"### Part {i} of {len(section_summaries)}\n{summary}"
+            for i, summary in enumerate(section_summaries, 1)
+        )
+        source = f"The transcript is long, so here are summaries of its parts, in order:\n\n{parts}"
+    return {
+        "model": CLAUDE_MODEL,
+        "max_tokens": max_tokens,
+        "system": SINGLE_SHOT_SYSTEM_PROMPT,
+        "messages": [
+            {
+                "role": "user",
+                "content": f"""Audio file: {filename}
+Recorded: {timestamp}
+
+Related notes in "{NOTES_FOLDER}", most relevant first:
+{listing}
+
+{source}"""
+            }
+        ],
+    }
+
+
+def note_from_message(filename, transcript, message):
+    """Turn a single-shot reply into {"path", "content", "written"}, or None if unusable."""
+    text = "".join(block.text for block in message.content if block.type == "text")
+    markdown = strip_code_fence(text)
+    if message.stop_reason != "end_turn" or not markdown:
+        print(f"[WARNING] Single-shot note unusable (stop reason: {message.stop_reason})")
+        return None
+    content = f"{markdown}\n\n## Transcript\n\n{transcript.strip()}\n"
+    return {"path": note_path_for(filename), "content": content, "written": False}
+
+
+def generate_note_single_shot(filename, transcript, related, section_summaries=None, max_tokens=8000):
+    """One Claude call, no tools: the related notes are already in the prompt.
+
+    Returns {"path", "content", "written"} with the full transcript appended
+    by the pipeline, or None if Claude returned nothing usable.
+    """
+    params = single_shot_request(filename, transcript, related, section_summaries, max_tokens)
+
+    print("[CLAUDE] Sending to Claude API (single-shot)...")
+    response = stream_message("single-shot", **params)
+    return note_from_message(filename, transcript, response)
+
+
+def split_transcript(transcript, max_chars):
+    """Split a transcript into pieces of at most max_chars on sentence boundaries."""
+    pieces = []
+    current = ""
+    for sentence in re.split(r"(?<=[.!?])\s+", transcript.strip()):
+        while len(sentence) > max_chars:
+            # No sentence boundary in sight — cut at the last space instead
+            cut = sentence.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(sentence[:cut])
+            sentence = sentence[cut:].lstrip()
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            pieces.append(current)
+            current = ""
+        current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def summarize_section(index, total, text):
+    """Map step: condense one part of a long transcript."""
+    response = stream_message(
+        f"map {index}/{total}",
+        model=CLAUDE_MODEL,
+        max_tokens=MAP_SUMMARY_MAX_TOKENS,
+        system=MAP_SYSTEM_PROMPT,
+        messages=[{"role": "user", "content": f"Part {index} of {total}:\n\n{text}"}]
+    )
+    return "".join(block.text for block in response.content if block.type == "text").strip()
+
+
+def generate_note_map_reduce(filename, transcript, related, max_tokens=8000):
+    """Summarize sentence-aligned parts concurrently, then reduce to one note."""
+    sections = split_transcript(transcript, MAP_CHUNK_CHARS)
+    print(f"[CLAUDE] Map-reduce: {len(transcript)} chars in {len(sections)} parts, "
+          f"{MAP_REDUCE_PARALLELISM} at a time")
+    with concurrent.futures.ThreadPoolExecutor(max_workers=MAP_REDUCE_PARALLELISM) as executor:
+        summaries = list(executor.map(
+            lambda item: summarize_section(item[0], len(sections), item[1]),
+            enumerate(sections, 1),
+        ))
+    return generate_note_single_shot(filename, transcript, related, summaries, max_tokens)
+
+
+def note_max_tokens(input_tokens):
+    """max_tokens for a tool-free note: twice the expected note size, bounded."""
+    expected = NOTE_BASE_TOKENS + NOTE_TOKENS_PER_INPUT_TOKEN * input_tokens
+    return int(min(NOTE_MAX_MAX_TOKENS, max(NOTE_MIN_MAX_TOKENS, 2 * expected)))
+
+
+def plan_note(filename, transcript, related):
+    """Pre-flight: count the single-shot prompt and pick the request shape.
+
+    Returns {"shape", "input_tokens", "counted", "max_tokens",
+    "tool_max_tokens"}. The shape is "single" if the whole prompt is within
+    MAP_REDUCE_THRESHOLD_TOKENS, otherwise "map-reduce", or "tools" when
+    NOTE_MODE=tools. max_tokens follows the expected note size; the tool
+    loop also has to write the (possibly truncated) transcript back out in
+    its create_note call, so it gets room for that too.
+    """
+    params = single_shot_request(filename, transcript, related)
+    input_tokens, counted = count_input_tokens(params)
+    transcript_tokens = input_tokens * min(len(transcript), MAX_TRANSCRIPT_CHARS) // max(len(transcript), 1)
+    if input_tokens > MAP_REDUCE_THRESHOLD_TOKENS:
+        shape = "map-reduce"
+    else:
+        shape = "single" if NOTE_MODE == "single" else "tools"
+    plan = {
+        "shape": shape,
+        "input_tokens": input_tokens,
+        "counted": counted,
+        "max_tokens": note_max_tokens(input_tokens),
+        "tool_max_tokens": min(CLAUDE_MAX_OUTPUT_TOKENS,
+                               transcript_tokens + note_max_tokens(transcript_tokens)),
+    }
+    print(f"[CLAUDE] Plan: {shape} | input={input_tokens} tokens ({counted}) | max_tokens={plan['max_tokens']}")
+    return plan
+
+
+def create_note(filename, transcript):
+    """Generate the note for a transcript in the shape plan_note() picks.
+
+    Long prompts go through map-reduce instead of being truncated. If the
+    vault can't be listed the note is still written single-shot, just with
+    no related notes: the tool loop needs Obsidian too, so it would only
+    burn calls. Falls back to the tool loop when a tool-free reply is
+    unusable. Returns {"path", "content", "written", "plan"}, where plan
+    records the token count and the shape that produced the note.
+    """
+    related = []
+    if NOTE_MODE == "single":
+        try:
+            related = related_notes(transcript)
+        except ObsidianError as e:
+            print(f"[OBSIDIAN] Could not list {NOTES_FOLDER} ({e}), writing without related links")
+    plan = plan_note(filename, transcript, related)
+
+    note = None
+    if plan["shape"] == "map-reduce":
+        note = generate_note_map_reduce(filename, transcript, related, plan["max_tokens"])
+        if note is None:
+            print("[CLAUDE] Map-reduce reduce step unusable, falling back to tool loop")
+    elif plan["shape"] == "single":
+        note = generate_note_single_shot(filename, transcript, related, max_tokens=plan["max_tokens"])
+        if note is None:
+            print("[CLAUDE] Falling back to tool loop")
+    if note is None:
+        plan["shape"] = "tools"
+        note = create_obsidian_note_via_mcp(filename, transcript, plan["tool_max_tokens"])
+    else:
+        print("[CLAUDE] Note creation complete.")
+    note["plan"] = plan
+    return note
+
 
 def archive_audio(file_path):
     os.makedirs(ARCHIVE_DIR, exist_ok=True)
@@ -302,25 +1013,142 @@ def archive_audio(file_path):
     print(f"[ARCHIVED] {os.path.basename(file_path)}")
 
 
-def process_audio_file(file_path):
-    filename = os.path.basename(file_path)
+def new_job(file_path):
+    """Create the job record that is passed from stage to stage."""
+    return {"file_path": file_path, "filename": os.path.basename(file_path)}
+
+
+def print_job_banner(job):
     print(f"\n{'='*50}")
-    print(f"[START] Processing: {filename}")
+    print(f"[START] Processing: {job['filename']}")
     print(f"[TIME] {datetime.now().strftime('%m-%d-%y %H:%M:%S')}")
     print(f"{'='*50}")
 
+
+def transcribe_file(file_path):
+    """Strip silence and transcribe, for callers outside the staged pipeline.
+
+    A long recording is decoded and run through VAD on the calling thread
+    while a helper thread feeds its chunks to the transcription pool.
+    """
+    audio, is_temp = strip_silence(file_path)
+    if isinstance(audio, (str, np.ndarray)):
+        return transcribe_cleaned(file_path, audio, is_temp)
+    feed = ChunkFeed()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        transcript = executor.submit(transcribe_cleaned, file_path, feed, False)
+        feed.feed(audio)
+        return transcript.result()
+
+
+def stage_decode(job):
+    """Decode + VAD: produce the cleaned audio that Whisper will read.
+
+    Skipped when the job's checkpoint or the transcript cache already has
+    the transcript. For a long recording the job moves on to transcription
+    straight away (the yield) while this worker keeps decoding and running
+    VAD into the job's ChunkFeed, on its own VAD model; the stage's timing
+    covers the whole decode.
+    """
+    print_job_banner(job)
+    hit = load_cached_transcript(job)
+    job["checkpoint"] = record = checkpoints.load(job["content_hash"])
+    resume = checkpoints.resume_point(record)
+    if resume != checkpoints.TRANSCRIBED:
+        print(f"[CHECKPOINT] Resuming at stage: {resume or 'done'}")
+        job["transcript"] = record.get("transcript", job.get("transcript"))
+        return
+    if hit:
+        return
+    print(f"[TRANSCRIBING] {job['file_path']}")
+    audio, is_temp = strip_silence(job["file_path"])
+    if isinstance(audio, (str, np.ndarray)):
+        job["audio"], job["audio_is_temp"] = audio, is_temp
+        return
+    feed = ChunkFeed()
+    job["audio"], job["audio_is_temp"] = feed, False
+    yield
+    feed.feed(audio)
+
+
+def stage_transcribe(job):
+    record = job["checkpoint"]
+    if "transcript" not in job:
+        job["transcript"] = transcribe_cleaned(
+            job["file_path"], job.pop("audio"), job.pop("audio_is_temp")
+        )
+        store_transcript(job)
+    if not checkpoints.done(record, checkpoints.TRANSCRIBED):
+        checkpoints.mark(record, checkpoints.TRANSCRIBED, transcript=job["transcript"])
+
+
+def stage_note(job):
+    record = job["checkpoint"]
+    if checkpoints.done(record, checkpoints.NOTE_GENERATED):
+        return
+    note = create_note(job["filename"], job["transcript"])
+    checkpoints.mark(record, checkpoints.NOTE_GENERATED, note_path=note["path"], markdown=note["content"],
+                     request=note["plan"])
+    if note.get("written"):
+        checkpoints.mark(record, checkpoints.NOTE_WRITTEN)
+
+
+def stage_archive(job):
+    """Write the note unless Claude's tool loop already did, then archive the audio."""
+    record = job["checkpoint"]
+    if not checkpoints.done(record, checkpoints.NOTE_WRITTEN):
+        result = write_note(record["note_path"], record["markdown"])
+        if not result["success"]:
+            raise RuntimeError(f"Could not write note to Obsidian: {record['note_path']}")
+        checkpoints.mark(record, checkpoints.NOTE_WRITTEN)
+    archive_audio(job["file_path"])
+    checkpoints.mark(record, checkpoints.ARCHIVED)
+    timings = ", ".join(f"{k}={v:.1f}s" for k, v in job.get("timings", {}).items())
+    print(f"[DONE] {job['filename']} completed successfully. {timings}\n")
+
+
+PIPELINE_STAGES = [
+    ("decode", stage_decode),
+    ("transcribe", stage_transcribe),
+    ("note", stage_note),
+    ("archive", stage_archive),
+]
+
+
+def fail_job(job, error):
+    """Move a failed file to the error folder instead of leaving it in the inbox."""
+    filename = job["filename"]
+    print(f"[ERROR] Failed to process {filename}: {error}")
+    audio = job.pop("audio", None)
+    if isinstance(audio, ChunkFeed):
+        audio.close()
+    if job.pop("audio_is_temp", False) and os.path.exists(audio):
+        os.unlink(audio)
+    error_dir = "/watch/input/errors"
+    os.makedirs(error_dir, exist_ok=True)
     try:
-        transcript = transcribe_audio(file_path)
-        create_obsidian_note_via_mcp(filename, transcript)
-        archive_audio(file_path)
-        print(f"[DONE] {filename} completed successfully.\n")
-    except Exception as e:
-        print(f"[ERROR] Failed to process {filename}: {e}")
-        # Move to an error folder instead of leaving it in the inbox
-        error_dir = "/watch/input/errors"
-        os.makedirs(error_dir, exist_ok=True)
-        try:
-            os.rename(file_path, os.path.join(error_dir, filename))
-            print(f"[ERROR] File moved to errors folder for review")
-        except Exception:
-            pass
+        os.rename(job["file_path"], os.path.join(error_dir, filename))
+        print(f"[ERROR] File moved to errors folder for review")
+    except Exception:
+        pass
+
+
+def build_staged_pipeline(on_done=None, on_failed=None):
+    """Wire the pipeline stages into a concurrent StagedPipeline.
+
+    `on_done(job)` runs after a job's last stage; `on_failed(job, error)`
+    runs after fail_job has moved a failed file aside.
+    """
+    # Decode workers each need their own VAD model; load it before the first file arrives
+    init = {"decode": get_vad_model} if WARM_UP_MODELS else {}
+    stages = [
+        Stage(name, func, STAGE_WORKERS[name], STAGE_QUEUE_SIZE, init=init.get(name))
+        for name, func in PIPELINE_STAGES
+    ]
+
+    def on_error(job, error):
+        fail_job(job, error)
+        if on_failed is not None:
+            on_failed(job, error)
+
+    return StagedPipeline(stages, on_error=on_error, on_done=on_done)
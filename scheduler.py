@@ -0,0 +1,132 @@
+"""Orders ready files before they enter the staged pipeline.
+
+The watcher puts every ready file here and the dispatcher takes the most
+urgent one whenever a decode worker is free, so after downtime a pile of
+short voice memos is not stuck behind one three-hour recording. Policies
+(SCHEDULE_POLICY):
+
+- shortest: shortest audio first. Waiting counts against a file's length
+  (SCHEDULE_AGING seconds of audio per second waited), so a long recording
+  is never starved by a steady stream of short ones.
+- oldest: earliest recording (file modification time) first.
+- fifo: in the order files became ready.
+
+Manual priority beats every policy. A filename starting with "!" (or "!!",
+and so on) gets that many levels; a sidecar file named "<audio file>.priority"
+holding an integer sets the level outright, and negative values defer a
+file. Sidecars are re-read while a file waits, so a queued recording can be
+bumped, and are removed once the file is dispatched.
+"""
+
+import os
+import time
+import itertools
+import threading
+
+from media import probe_duration
+
+SCHEDULE_POLICY = os.environ.get("SCHEDULE_POLICY", "shortest")
+SCHEDULE_AGING = float(os.environ.get("SCHEDULE_AGING", "1.0"))
+POLICIES = ("shortest", "oldest", "fifo")
+PRIORITY_MARKER = "!"
+# Used when ffprobe can't read a file: 128 kbps, typical for phone recordings
+FALLBACK_BYTES_PER_SECOND = 16000
+
+
+def probe_seconds(file_path):
+    """Audio duration in seconds from the container header via ffprobe.
+
+    Falls back to an estimate from the file size, so an unreadable header
+    only makes the ordering approximate.
+    """
+    duration = probe_duration(file_path, timeout=10)
+    if duration is not None:
+        return duration
+    try:
+        return os.path.getsize(file_path) / FALLBACK_BYTES_PER_SECOND
+    except OSError:
+        return 0.0
+
+
+def strip_priority_marker(name):
+    """A filename without its leading "!" priority marker, for note titles."""
+    return name.lstrip(PRIORITY_MARKER).lstrip() or name
+
+
+def sidecar_path(file_path):
+    return f"{file_path}.priority"
+
+
+def read_priority(file_path):
+    """Manual priority level: the sidecar's integer if present, else the filename's "!" count."""
+    try:
+        with open(sidecar_path(file_path), "r") as f:
+            return int(f.read().strip() or 0)
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        print(f"[SCHEDULER] Ignoring unreadable priority sidecar for {os.path.basename(file_path)} ({e})")
+    name = os.path.basename(file_path)
+    return len(name) - len(name.lstrip(PRIORITY_MARKER))
+
+
+class Scheduler:
+    """Thread-safe queue of ready files that hands out the most urgent first.
+
+    put() probes the file, so it runs on the caller's thread (the readiness
+    timer), never on the dispatcher. get() blocks until a file is waiting.
+    """
+
+    def __init__(self, policy=SCHEDULE_POLICY, aging=SCHEDULE_AGING):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown SCHEDULE_POLICY {policy!r}, expected one of {', '.join(POLICIES)}")
+        self.policy = policy
+        self.aging = aging
+        self._items = []
+        self._order = itertools.count()
+        self._ready = threading.Condition()
+
+    def put(self, file_path, content_hash):
+        try:
+            recorded = os.path.getmtime(file_path)
+        except OSError:
+            recorded = time.time()
+        item = {
+            "file_path": file_path,
+            "content_hash": content_hash,
+            "seconds": probe_seconds(file_path) if self.policy == "shortest" else None,
+            "recorded": recorded,
+            "queued": time.monotonic(),
+            "order": next(self._order),
+        }
+        with self._ready:
+            self._items.append(item)
+            waiting = len(self._items)
+            self._ready.notify()
+        length = f"{item['seconds'] / 60:.1f} min, " if item["seconds"] is not None else ""
+        print(f"[QUEUED] {os.path.basename(file_path)} ({length}{waiting} waiting)")
+
+    def get(self):
+        """Remove and return the most urgent (file_path, content_hash)."""
+        with self._ready:
+            while not self._items:
+                self._ready.wait()
+            now = time.monotonic()
+            item = min(self._items, key=lambda item: self._rank(item, now))
+            self._items.remove(item)
+        try:
+            os.remove(sidecar_path(item["file_path"]))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"[SCHEDULER] Could not remove priority sidecar ({e})")
+        return item["file_path"], item["content_hash"]
+
+    def _rank(self, item, now):
+        """Sort key; the smallest runs first."""
+        urgency = -read_priority(item["file_path"])
+        if self.policy == "shortest":
+            return urgency, item["seconds"] - self.aging * (now - item["queued"]), item["order"]
+        if self.policy == "oldest":
+            return urgency, item["recorded"], item["order"]
+        return urgency, item["order"]
@@ -0,0 +1,149 @@
+"""Staged, concurrent execution engine for the audio pipeline.
+
+Each stage owns a bounded input queue and its own pool of worker threads.
+A job (a plain dict) flows from one stage's queue to the next, so Whisper
+can transcribe file N+1 while Claude is still writing the note for file N.
+Bounded queues provide backpressure: a slow stage fills its queue and the
+stage in front of it blocks instead of piling decoded audio into memory.
+"""
+
+import queue
+import inspect
+import threading
+import time
+
+_STOP = object()
+
+
+class Stage:
+    """One step of the pipeline: a function applied to each job.
+
+    `init`, if given, runs once in each worker thread before its first job,
+    for per-thread state such as a model that must not be shared.
+
+    `func` may be a generator function. The job then moves on to the next
+    stage at its first yield, and the rest of the function keeps running on
+    this worker, so a stage can stream its output into the next one. Once it
+    has yielded, the job belongs to the next stage: later errors must be
+    passed along inside the job rather than raised.
+    """
+
+    def __init__(self, name, func, workers=1, queue_size=2, init=None):
+        self.name = name
+        self.func = func
+        self.init = init
+        self.workers = max(1, workers)
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self.threads = []
+
+
+class StagedPipeline:
+    """Run jobs through a chain of stages with per-stage worker threads.
+
+    `on_error(job, exc)` is called when a stage raises; the job is dropped
+    from the chain. `on_done(job)` is called after the last stage succeeds.
+    """
+
+    def __init__(self, stages, on_error=None, on_done=None):
+        self.stages = stages
+        self.on_error = on_error
+        self.on_done = on_done
+        self._init_left = 0
+        self._initialized = threading.Condition()
+        # One slot per first-stage worker; a job holds its slot until that
+        # worker is free again, so nothing waits in the first queue
+        self._first_slots = threading.Semaphore(stages[0].workers)
+
+    def start(self):
+        self._init_left = sum(stage.workers for stage in self.stages if stage.init is not None)
+        for index, stage in enumerate(self.stages):
+            next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+            for n in range(stage.workers):
+                t = threading.Thread(
+                    target=self._worker,
+                    args=(stage, next_stage),
+                    name=f"{stage.name}-{n + 1}",
+                    daemon=True,
+                )
+                t.start()
+                stage.threads.append(t)
+        summary = ", ".join(f"{s.name}×{s.workers}" for s in self.stages)
+        print(f"[PIPELINE] Started stages: {summary}")
+
+    def reserve(self):
+        """Block until a first-stage worker is free and hold it for submit(job, reserved=True).
+
+        Lets a caller choose which job to submit at the last moment.
+        """
+        self._first_slots.acquire()
+
+    def submit(self, job, reserved=False):
+        """Hand a job to the first stage. Blocks until one of its workers is free."""
+        if not reserved:
+            self._first_slots.acquire()
+        self.stages[0].queue.put(job)
+
+    def wait_initialized(self):
+        """Block until every worker's stage init hook has run."""
+        with self._initialized:
+            self._initialized.wait_for(lambda: self._init_left == 0)
+
+    def join(self):
+        """Block until every submitted job has left the pipeline."""
+        for stage in self.stages:
+            stage.queue.join()
+
+    def stop(self):
+        """Let in-flight jobs drain, then shut down all worker threads."""
+        self.join()
+        for stage in self.stages:
+            for _ in stage.threads:
+                stage.queue.put(_STOP)
+            for t in stage.threads:
+                t.join()
+            stage.threads = []
+
+    def _worker(self, stage, next_stage):
+        if stage.init is not None:
+            try:
+                stage.init()
+            except Exception as e:
+                print(f"[PIPELINE] {stage.name} worker init failed ({e}), continuing without it")
+            finally:
+                with self._initialized:
+                    self._init_left -= 1
+                    self._initialized.notify_all()
+        while True:
+            job = stage.queue.get()
+            if job is _STOP:
+                stage.queue.task_done()
+                return
+            start = time.monotonic()
+            handed_on = False
+            try:
+                result = stage.func(job)
+                if inspect.isgenerator(result):
+                    for _ in result:
+                        if not handed_on:
+                            handed_on = True
+                            self._hand_on(job, next_stage)
+                job.setdefault("timings", {})[stage.name] = time.monotonic() - start
+                if not handed_on:
+                    self._hand_on(job, next_stage)
+            except Exception as e:
+                if handed_on:
+                    print(f"[ERROR] Stage {stage.name} failed after handing {job.get('filename', 'job')} on: {e}")
+                elif self.on_error is not None:
+                    self.on_error(job, e)
+                else:
+                    print(f"[ERROR] Stage {stage.name} failed: {e}")
+            finally:
+                stage.queue.task_done()
+                if stage is self.stages[0]:
+                    self._first_slots.release()
+
+    def _hand_on(self, job, next_stage):
+        if next_stage is not None:
+            next_stage.queue.put(job)
+        elif self.on_done is not None:
+            self.on_done(job)
@@ -0,0 +1,41 @@
+"""Startup timing — how long each import and model load took since boot.
+
+Import this module first so the process start time is captured early.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+_BOOT = time.monotonic()
+_timings = []
+_lock = threading.Lock()
+
+
+def since_boot():
+    return time.monotonic() - _BOOT
+
+
+@contextmanager
+def timed(component):
+    """Record the wall-clock time spent inside the block under `component`."""
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        record(component, time.monotonic() - start)
+
+
+def record(component, seconds):
+    """Record a duration measured elsewhere, e.g. in a worker process."""
+    with _lock:
+        _timings.append((component, seconds))
+
+
+def report():
+    """Print every recorded component in the order it finished."""
+    with _lock:
+        timings = list(_timings)
+    print(f"[STARTUP] Timing report ({since_boot():.2f}s since boot):")
+    for component, seconds in timings:
+        print(f"[STARTUP]   {component:<28} {seconds:6.2f}s")
@@ -0,0 +1,38 @@
+from asr import SAMPLING_RATE, SpanGrouper, retained_from
+
+SECOND = SAMPLING_RATE
+
+
+def test_spans_close_at_min_length():
+    grouper = SpanGrouper(min_seconds=30, max_seconds=60)
+    assert grouper.add(0, 20 * SECOND) == []
+    assert grouper.add(22 * SECOND, 35 * SECOND) == [(0, 35 * SECOND)]
+    assert grouper.open_start is None
+
+
+def test_span_closed_before_it_would_pass_max_length():
+    grouper = SpanGrouper(min_seconds=30, max_seconds=60)
+    grouper.add(0, 10 * SECOND)
+    assert grouper.add(70 * SECOND, 75 * SECOND) == [(0, 10 * SECOND)]
+    assert grouper.flush() == [(70 * SECOND, 75 * SECOND)]
+
+
+def test_long_segment_split_into_max_length_pieces():
+    grouper = SpanGrouper(min_seconds=30, max_seconds=60)
+    spans = grouper.add(0, 150 * SECOND) + grouper.flush()
+    assert spans == [(0, 60 * SECOND), (60 * SECOND, 120 * SECOND), (120 * SECOND, 150 * SECOND)]
+
+
+def test_expire_closes_span_that_can_no_longer_grow():
+    grouper = SpanGrouper(min_seconds=30, max_seconds=60)
+    grouper.add(0, 2 * SECOND)
+    assert grouper.expire(59 * SECOND) == []
+    assert grouper.expire(60 * SECOND) == [(0, 2 * SECOND)]
+    assert grouper.expire(120 * SECOND) == []
+
+
+def test_retained_from_ignores_closed_positions():
+    assert retained_from(None, None, 500) == 500
+    assert retained_from(100, None, 500) == 100
+    assert retained_from(300, 200, 500) == 200
+
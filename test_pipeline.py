@@ -0,0 +1,79 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+import silero_vad
+
+import clients
+import pipeline
+from fake_servers import FakeAnthropicServer, start
+
+
+@pytest.fixture
+def slow_claude(monkeypatch):
+    # Half a token per second: one 16-char delta every 8s, well past the idle timeout
+    server = start(FakeAnthropicServer(("127.0.0.1", 0), tokens_per_second=0.5))
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "fake")
+    monkeypatch.setenv("ANTHROPIC_BASE_URL", server.base_url)
+    monkeypatch.setattr(clients, "_anthropic", None)
+    monkeypatch.setattr(pipeline, "CLAUDE_IDLE_TIMEOUT_SECONDS", 1.0)
+    yield server
+    server.shutdown()
+
+
+def test_stalled_stream_is_reported(slow_claude, capsys):
+    with pytest.raises(RuntimeError, match="stream stalled"):
+        pipeline.stream_message(
+            "stall test", model=pipeline.CLAUDE_MODEL, max_tokens=100,
+            messages=[{"role": "user", "content": "hello"}],
+        )
+    assert "idle for 1s" in capsys.readouterr().out
+
+
+class ScriptedVAD:
+    """Stands in for silero_vad.VADIterator: returns scripted events by samples fed."""
+
+    def __init__(self, events):
+        self.events = events
+        self.fed = 0
+
+    def __call__(self, window):
+        self.fed += len(window)
+        return self.events.get(self.fed)
+
+    def reset_states(self):
+        pass
+
+
+def test_streaming_vad_cuts_early_and_stays_bounded(monkeypatch):
+    rate = pipeline.SAMPLING_RATE
+    decode_samples = pipeline.DECODE_CHUNK_SECONDS * rate
+    total = 20 * 60 * rate  # one utterance, then twenty minutes of silence
+    start, end = 512 * 31, 512 * 90
+    events = {start + 512: {"start": start}, end + 512: {"end": end}}
+    decoded = {"samples": 0}
+
+    def decode(file_path, chunk_seconds=pipeline.DECODE_CHUNK_SECONDS, ring_slots=2):
+        while decoded["samples"] < total:
+            audio = np.zeros(decode_samples, dtype=np.float32)
+            if decoded["samples"] == 0:
+                audio[start:end] = 0.5
+            yield audio
+            decoded["samples"] += decode_samples
+
+    monkeypatch.setattr(pipeline, "stream_audio_16k", decode)
+    monkeypatch.setattr(pipeline, "get_vad_model", lambda: None)
+    monkeypatch.setattr(silero_vad, "VADIterator", lambda model, **options: ScriptedVAD(events))
+
+    tracemalloc.start()
+    chunks = []
+    for offset, audio in pipeline.stream_speech_chunks("recording.m4a"):
+        chunks.append((offset, len(audio), float(audio.max()), decoded["samples"]))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    assert [chunk[:3] for chunk in chunks] == [(start / rate, end - start, 0.5)]
+    # Cut once the span can no longer grow, not at the end of the file
+    assert chunks[0][3] <= (pipeline.CHUNK_MAX_SECONDS + 2 * pipeline.DECODE_CHUNK_SECONDS) * rate
+    # The whole recording would be 77 MB; only about one span plus decode chunks is held
+    assert peak < 16 * 1024 * 1024
@@ -0,0 +1,88 @@
+"""On-disk transcript cache keyed by audio content hash and ASR parameters.
+
+Each entry is a small JSON file named after its key. Reads bump the file's
+mtime, so mtime order is recency order; once the cache directory grows past
+TRANSCRIPT_CACHE_MAX_MB the least recently used entries are evicted.
+Cache errors are logged and never fail a job.
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import threading
+
+CACHE_DIR = os.environ.get("TRANSCRIPT_CACHE_DIR", "/watch/input/.cache/transcripts")
+CACHE_MAX_BYTES = int(float(os.environ.get("TRANSCRIPT_CACHE_MAX_MB", "200")) * 1024 * 1024)
+
+_evict_lock = threading.Lock()
+
+
+def file_sha256(path, block_size=1024 * 1024):
+    """Hex SHA-256 of a file's contents, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_key(content_hash, params):
+    """Combine the audio hash with every parameter that changes the transcript."""
+    payload = json.dumps({"audio": content_hash, "params": params}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _entry_path(key):
+    return os.path.join(CACHE_DIR, f"{key}.json")
+
+
+def get(key):
+    """Return the cached entry dict for `key`, or None."""
+    path = _entry_path(key)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+        os.utime(path)  # mark as recently used
+        return entry
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"[CACHE] Unreadable entry {key[:12]} ({e}), ignoring")
+        return None
+
+
+def put(key, entry):
+    """Store an entry atomically, then evict old entries if over the size limit."""
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, prefix=".tmp-", suffix=".json")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, _entry_path(key))
+    except OSError as e:
+        print(f"[CACHE] Failed to store transcript ({e})")
+        return
+    evict()
+
+
+def evict(max_bytes=CACHE_MAX_BYTES):
+    """Delete least recently used entries until the cache fits in max_bytes."""
+    with _evict_lock:
+        entries = []
+        try:
+            for entry in os.scandir(CACHE_DIR):
+                if entry.name.endswith(".json") and not entry.name.startswith("."):
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+        except OSError:
+            return
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except OSError:
+                pass
@@ -0,0 +1,231 @@
+"""Local SQLite index of vault notes, used to pick related notes for linking.
+
+Each row holds what a note is about: title, date, frontmatter tags,
+headings and outgoing [[links]]. Notes are upserted as the pipeline writes
+them, and refresh() reconciles a folder against the REST listing by only
+fetching names the index has not seen and dropping names that are gone.
+related() ranks the index against a transcript locally, so the prompt
+carries the top-k candidates instead of the whole folder listing.
+
+The index lives in the container's pipeline-state volume, not on the
+/watch/input share: the watcher and backlog.py (run with docker compose exec)
+open it at the same time, and SQLite's locking and WAL need one kernel.
+"""
+
+import os
+import re
+import json
+import math
+import sqlite3
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+VAULT_INDEX_PATH = os.environ.get("VAULT_INDEX_PATH", "/var/lib/audio-pipeline/vault_index.sqlite")
+
+_lock = threading.Lock()
+
+_FRONTMATTER = re.compile(r"\A---\s*\n(.*?)\n---\s*\n", re.S)
+_HEADING = re.compile(r"^#{1,6}\s+(.+?)\s*#*\s*$", re.M)
+_LINK = re.compile(r"\[\[([^\]|#]+)")
+_INLINE_TAG = re.compile(r"(?<![\w/#])#([A-Za-z][\w/-]*)")
+_FILENAME_DATE = re.compile(r"^(\d{2}-\d{2}-\d{2,4})\b")
+_WORD = re.compile(r"[a-z][a-z0-9'-]{2,}")
+
+# Common words that say nothing about what a note is about
+_STOPWORDS = set("""
+the and for that this with you are was were have has had not but they their them then than
+there here what when where which who will would could should about into from your our out
+just like yeah okay know think going get got its it's can all one two also been being very
+really some more any because did does doing don't didn't i'm we're they're that's let's
+summary key points action items transcript note notes audio recording related links
+""".split())
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS notes (
+    path TEXT PRIMARY KEY,
+    folder TEXT NOT NULL,
+    title TEXT NOT NULL,
+    date TEXT,
+    tags TEXT NOT NULL,
+    headings TEXT NOT NULL,
+    links TEXT NOT NULL,
+    terms TEXT NOT NULL,
+    indexed_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS notes_folder ON notes (folder);
+"""
+
+
+@contextmanager
+def _connect():
+    """A short-lived connection, committed and closed on exit."""
+    os.makedirs(os.path.dirname(VAULT_INDEX_PATH), exist_ok=True)
+    conn = sqlite3.connect(VAULT_INDEX_PATH, timeout=30)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def _terms(text):
+    return [word for word in _WORD.findall(text.lower()) if word not in _STOPWORDS]
+
+
+def _frontmatter_list(value, lines):
+    """A YAML list written inline ([a, b]) or as indented "- item" lines."""
+    value = value.strip()
+    if value.startswith("[") and value.endswith("]"):
+        return [item.strip().strip("\"'") for item in value[1:-1].split(",") if item.strip()]
+    if value:
+        return [value.strip("\"'")]
+    items = []
+    for line in lines:
+        stripped = line.strip()
+        if not stripped.startswith("- "):
+            break
+        items.append(stripped[2:].strip().strip("\"'"))
+    return items
+
+
+def parse_note(path, markdown):
+    """Extract title, date, tags, headings and outgoing links from a note."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    tags, date = [], None
+    body = markdown
+    match = _FRONTMATTER.match(markdown)
+    if match:
+        body = markdown[match.end():]
+        lines = match.group(1).splitlines()
+        for i, line in enumerate(lines):
+            key, sep, value = line.partition(":")
+            if not sep or line[:1].isspace():
+                continue
+            key = key.strip().lower()
+            if key in ("tags", "tag"):
+                tags += _frontmatter_list(value, lines[i + 1:])
+            elif key == "date" and value.strip():
+                date = value.strip().strip("\"'")
+    # Transcript text is noise for ranking; only the structured part counts
+    body = body.split("\n## Transcript", 1)[0]
+    tags += _INLINE_TAG.findall(body)
+    if date is None:
+        found = _FILENAME_DATE.match(name)
+        date = found.group(1) if found else None
+    # Template headings like "Key Points" carry no topic, so they are left out
+    headings = [h for h in _HEADING.findall(body) if _terms(h)]
+    links = sorted({link.strip() for link in _LINK.findall(body)})
+    tags = sorted({tag.lstrip("#") for tag in tags if tag})
+    # Title and tags count double: they name the topic, headings only touch on it
+    terms = Counter(_terms(" ".join([name, name] + tags * 2 + headings + links)))
+    return {
+        "path": path,
+        "folder": path.rpartition("/")[0],
+        "title": name,
+        "date": date,
+        "tags": tags,
+        "headings": headings,
+        "links": links,
+        "terms": dict(terms),
+    }
+
+
+def upsert(path, markdown):
+    """Index or re-index one note. Index errors are logged, never raised."""
+    note = parse_note(path, markdown)
+    try:
+        with _lock, _connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO notes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    note["path"], note["folder"], note["title"], note["date"],
+                    json.dumps(note["tags"]), json.dumps(note["headings"]),
+                    json.dumps(note["links"]), json.dumps(note["terms"]),
+                    datetime.now().isoformat(timespec="seconds"),
+                ),
+            )
+    except sqlite3.Error as e:
+        print(f"[INDEX] Failed to index {path} ({e})")
+
+
+def indexed_names(folder):
+    with _lock, _connect() as conn:
+        rows = conn.execute("SELECT path FROM notes WHERE folder = ?", (folder,)).fetchall()
+    return {path.rpartition("/")[2] for (path,) in rows}
+
+
+def refresh(folder, listing, fetch_many):
+    """Bring the index for `folder` in line with a REST listing of it.
+
+    Only names the index has not seen are fetched, in one call to
+    `fetch_many(paths)`, which returns ({path: markdown or None},
+    {path: error}) like ObsidianClient.get_many. Names missing from the
+    listing are deleted. Returns (added, removed) counts.
+    """
+    listing = {name for name in listing if name.endswith(".md")}
+    try:
+        known = indexed_names(folder)
+    except sqlite3.Error as e:
+        print(f"[INDEX] Unreadable index ({e}), skipping refresh")
+        return 0, 0
+    added = 0
+    fetched, failed = fetch_many([f"{folder}/{name}" for name in sorted(listing - known)])
+    for path, markdown in fetched.items():
+        if markdown is not None:
+            upsert(path, markdown)
+            added += 1
+    for path, error in failed.items():
+        print(f"[INDEX] Could not fetch {path} ({error})")
+    removed = sorted(known - listing)
+    if removed:
+        with _lock, _connect() as conn:
+            conn.executemany("DELETE FROM notes WHERE path = ?", [(f"{folder}/{n}",) for n in removed])
+    if added or removed:
+        print(f"[INDEX] {folder}: +{added} -{len(removed)} notes")
+    return added, len(removed)
+
+
+def related(transcript, folder, k):
+    """Top-k notes in `folder` for a transcript, best first.
+
+    Scores each note by the transcript terms it shares with its title,
+    tags, headings and links, weighted by how rare the term is across the
+    index. Ties, and notes with no overlap at all, fall back to recency.
+    Returns dicts with "name", "title", "date", "tags" and "headings".
+    """
+    with _lock, _connect() as conn:
+        rows = conn.execute(
+            "SELECT path, title, date, tags, headings, terms FROM notes WHERE folder = ?", (folder,)
+        ).fetchall()
+    if not rows:
+        return []
+    notes = [
+        {
+            "name": path.rpartition("/")[2], "title": title, "date": date,
+            "tags": json.loads(tags), "headings": json.loads(headings), "terms": json.loads(terms),
+        }
+        for path, title, date, tags, headings, terms in rows
+    ]
+    document_freq = Counter(term for note in notes for term in note["terms"])
+    transcript_freq = Counter(_terms(transcript))
+    for note in notes:
+        note["score"] = sum(
+            math.log1p(transcript_freq[term]) * weight * math.log(1 + len(notes) / document_freq[term])
+            for term, weight in note.pop("terms").items()
+            if term in transcript_freq
+        )
+    notes.sort(key=lambda note: (note["score"], _sortable_date(note["date"])), reverse=True)
+    return notes[:k]
+
+
+def _sortable_date(date):
+    for text, fmt in ((date, "%m-%d-%y"), (date, "%m-%d-%Y"), ((date or "")[:10], "%Y-%m-%d")):
+        try:
+            return datetime.strptime(text, fmt).strftime("%Y-%m-%d")
+        except (TypeError, ValueError):
+            continue
+    return ""
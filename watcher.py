@@ -1,70 +1,247 @@
+from startup import report, since_boot, timed  # first, so boot time is measured from here
 import time
 import os
+import threading
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-from pipeline import process_audio_file
+
+import job_store
+from scheduler import Scheduler
+from transcript_cache import file_sha256
 
 WATCH_DIR = "/watch/input"
 SUPPORTED_EXTENSIONS = {".mp3", ".m4a", ".wav", ".ogg", ".flac"}
-PROCESSED = set()
+JOB_SOURCE = "watcher"
+# Readiness — see ReadinessTracker
+READY_DEBOUNCE_SECONDS = float(os.environ.get("READY_DEBOUNCE_SECONDS", "0.25"))
+READY_POLL_SECONDS = float(os.environ.get("READY_POLL_SECONDS", "5"))
+READY_TIMEOUT_SECONDS = 120
+# Ready files waiting for the pipeline, most urgent first — accepted even before it has loaded
+INBOX = Scheduler()
+# Container-side job history (job_store.py); opened at startup
+STORE = None
+
+def run_pipeline():
+    """Import the pipeline, start its stages and feed it files from INBOX.
+
+    A file is only taken from INBOX once a decode worker is free for it
+    (engine.reserve()), so everything else keeps waiting where the
+    scheduler can still reorder it.
+
+    Runs in a background thread so the watcher is live immediately; models
+    are loaded lazily or by the optional warm-up thread.
+    """
+    with timed("import pipeline"):
+        import pipeline
+    engine = pipeline.build_staged_pipeline(on_done=job_done, on_failed=job_failed)
+    engine.start()
+    if pipeline.WARM_UP_MODELS:
+        pipeline.warm_up(engine)
+    else:
+        report()
+    while True:
+        engine.reserve()
+        filepath, content_hash = INBOX.get()
+        job = pipeline.new_job(filepath)
+        job["content_hash"] = content_hash
+        STORE.update(content_hash, filepath, job_store.PROCESSING)
+        engine.submit(job, reserved=True)
+
+
+def job_done(job):
+    STORE.update(job["content_hash"], job["file_path"], job_store.DONE, stage_seconds=job.get("timings"))
+
+
+def job_failed(job, error):
+    STORE.update(job["content_hash"], job["file_path"], job_store.FAILED,
+                 error=str(error)[:1000], stage_seconds=job.get("timings"))
+
+
+class ReadinessTracker:
+    """Decide when each new file is fully written, without blocking the observer.
+
+    Every tracked file has its own timer. A close-after-write event marks
+    the file ready after a short debounce (READY_DEBOUNCE_SECONDS), and a
+    rename into place marks it ready at once. For filesystems that don't
+    emit those events, a file is also ready once its size has stayed the
+    same for READY_POLL_SECONDS; each modify event restarts that wait.
+    Files that never settle are dropped after READY_TIMEOUT_SECONDS.
+    """
+
+    def __init__(self, on_ready, on_timeout):
+        self.on_ready = on_ready
+        self.on_timeout = on_timeout
+        self._files = {}  # path -> {"size", "closed", "timer", "deadline"}
+        self._lock = threading.Lock()
+
+    def track(self, filepath):
+        """Start watching a file. Returns False if it is already tracked."""
+        with self._lock:
+            if filepath in self._files:
+                return False
+            self._files[filepath] = {
+                "size": self._size(filepath), "closed": False, "timer": None,
+                "deadline": time.monotonic() + READY_TIMEOUT_SECONDS,
+            }
+            self._schedule(filepath, READY_POLL_SECONDS)
+        return True
 
-def wait_for_file(filepath, timeout=120):
-    """Wait until file is fully written and not locked."""
-    start = time.time()
-    last_size = -1
-    while time.time() - start < timeout:
+    def modified(self, filepath):
+        with self._lock:
+            state = self._files.get(filepath)
+            if state is None:
+                return
+            state["size"] = self._size(filepath)
+            state["closed"] = False
+            self._schedule(filepath, READY_POLL_SECONDS)
+
+    def closed(self, filepath):
+        with self._lock:
+            state = self._files.get(filepath)
+            if state is None:
+                return
+            state["closed"] = True
+            self._schedule(filepath, READY_DEBOUNCE_SECONDS)
+
+    def moved_in(self, filepath):
+        """A file renamed into place was complete before the rename."""
+        self.track(filepath)
+        with self._lock:
+            state = self._files.get(filepath)
+            if state is not None:
+                state["closed"] = True
+                self._schedule(filepath, 0)
+
+    def _size(self, filepath):
         try:
-            if not os.path.exists(filepath):
-                print(f"[WAITING] File not ready yet: {filepath}")
-                time.sleep(5)
-                continue
-            current_size = os.path.getsize(filepath)
-            if current_size == last_size and current_size > 0:
-                with open(filepath, 'rb') as f:
-                    f.read(1024)
-                print(f"[READY] File is fully synced: {filepath}")
-                return True
-            last_size = current_size
-            print(f"[WAITING] File still syncing... size={current_size} bytes")
-        except (OSError, IOError) as e:
-            print(f"[WAITING] File not ready yet: {e}")
-        time.sleep(5)
-    return False
+            return os.path.getsize(filepath)
+        except OSError:
+            return None
 
-class AudioHandler(FileSystemEventHandler):
-    def on_created(self, event):
-        if event.is_directory:
-            return
-        filepath = event.src_path
-        fname = os.path.basename(filepath)
-        ext = os.path.splitext(filepath)[1].lower()
+    def _schedule(self, filepath, delay):
+        state = self._files[filepath]
+        if state["timer"] is not None:
+            state["timer"].cancel()
+        state["timer"] = threading.Timer(delay, self._check, args=(filepath,))
+        state["timer"].daemon = True
+        state["timer"].start()
 
-        if ext not in SUPPORTED_EXTENSIONS:
-            return
+    def _check(self, filepath):
+        with self._lock:
+            state = self._files.get(filepath)
+            if state is None:
+                return
+            size = self._size(filepath)
+            ready = False
+            if size:
+                try:
+                    with open(filepath, "rb") as f:
+                        f.read(1024)
+                    ready = state["closed"] or size == state["size"]
+                except OSError as e:
+                    print(f"[WAITING] File not readable yet: {e}")
+            if ready:
+                del self._files[filepath]
+            elif time.monotonic() > state["deadline"]:
+                del self._files[filepath]
+                ready = None
+            else:
+                if size != state["size"]:
+                    print(f"[WAITING] File still syncing... size={size} bytes")
+                state["size"] = size
+                self._schedule(filepath, READY_POLL_SECONDS)
+                return
+        if ready:
+            print(f"[READY] File is fully synced: {filepath}")
+            self.on_ready(filepath)
+        else:
+            self.on_timeout(filepath)
+
+
+def is_audio(filepath):
+    fname = os.path.basename(filepath)
+    ext = os.path.splitext(fname)[1].lower()
+    return ext in SUPPORTED_EXTENSIONS and not fname.startswith(".")
+
+
+def file_ready(filepath):
+    """Queue a ready file unless the same recording is already done or in flight."""
+    try:
+        content_hash = file_sha256(filepath)
+    except OSError as e:
+        print(f"[SKIPPED] Could not read {filepath}: {e}")
+        return
+    if not STORE.claim(content_hash, filepath, JOB_SOURCE):
+        latest = STORE.latest(content_hash)
+        print(f"[SKIPPED] Already {latest['status']}: {os.path.basename(filepath)} "
+              f"(same recording as {latest['filename']})")
+        return
+    INBOX.put(filepath, content_hash)
 
-        # Skip if already processed or file no longer exists
-        if fname in PROCESSED:
-            print(f"[SKIPPED] Already processed: {fname}")
-            return
 
-        if not os.path.exists(filepath):
-            print(f"[SKIPPED] File no longer exists: {fname}")
-            return
+def file_timed_out(filepath):
+    print(f"[SKIPPED] File never became ready: {filepath}")
 
+
+TRACKER = ReadinessTracker(file_ready, file_timed_out)
+
+
+def accept(filepath, moved=False):
+    """Start tracking a new audio file.
+
+    Repeated events for a file being tracked are ignored by the tracker;
+    whether the recording was already processed is decided by content
+    once it is ready (file_ready).
+    """
+    fname = os.path.basename(filepath)
+    if not os.path.exists(filepath):
+        print(f"[SKIPPED] File no longer exists: {fname}")
+        return
+    if moved:
+        print(f"[DETECTED] New audio file: {filepath}")
+        TRACKER.moved_in(filepath)
+    elif TRACKER.track(filepath):
         print(f"[DETECTED] New audio file: {filepath}")
-        PROCESSED.add(fname)
 
-        if wait_for_file(filepath):
-            process_audio_file(filepath)
-        else:
-            print(f"[SKIPPED] File never became ready: {filepath}")
-            PROCESSED.discard(fname)
+
+class AudioHandler(FileSystemEventHandler):
+    """Routes watchdog events to the tracker. Never blocks the observer thread."""
+
+    def on_created(self, event):
+        if not event.is_directory and is_audio(event.src_path):
+            accept(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory and is_audio(event.src_path):
+            TRACKER.modified(event.src_path)
+
+    def on_closed(self, event):
+        if not event.is_directory and is_audio(event.src_path):
+            TRACKER.closed(event.src_path)
+
+    def on_moved(self, event):
+        # Written under a temporary name, then renamed into place
+        dest = event.dest_path
+        if not event.is_directory and is_audio(dest) and os.path.dirname(dest) == WATCH_DIR:
+            accept(dest, moved=True)
 
 if __name__ == "__main__":
     print(f"[WATCHING] {WATCH_DIR} for audio files...")
     os.makedirs(WATCH_DIR, exist_ok=True)
+    STORE = job_store.JobStore()
+    interrupted = STORE.requeue_interrupted(JOB_SOURCE)
+    if interrupted:
+        print(f"[STARTUP] {interrupted} jobs were interrupted by the last shutdown and will be retried")
+
+    threading.Thread(target=run_pipeline, name="dispatcher", daemon=True).start()
+
+    event_handler = AudioHandler()
+    observer = Observer()
+    observer.schedule(event_handler, WATCH_DIR, recursive=False)
+    observer.start()
+    print(f"[STARTUP] Watcher live after {since_boot():.2f}s")
 
-    # Process any files already present before the observer starts
+    # Queue any files already present when the watcher started
     for fname in os.listdir(WATCH_DIR):
         ext = os.path.splitext(fname)[1].lower()
         if ext not in SUPPORTED_EXTENSIONS:
@@ -73,16 +250,8 @@ if __name__ == "__main__":
         if not os.path.isfile(filepath):
             continue
         print(f"[STARTUP] Found existing file: {fname}")
-        PROCESSED.add(fname)
-        if wait_for_file(filepath):
-            process_audio_file(filepath)
-        else:
-            PROCESSED.discard(fname)
+        accept(filepath)
 
-    event_handler = AudioHandler()
-    observer = Observer()
-    observer.schedule(event_handler, WATCH_DIR, recursive=False)
-    observer.start()
     try:
         while True:
             time.sleep(1)
@@ -20,7 +20,6 @@ from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from typing import Optional
 
-import requests
 import anthropic
 
 # ---------------------------------------------------------------------------
@@ -56,11 +55,16 @@ def load_env():
 # ---------------------------------------------------------------------------
 load_env()
 
-ANTHROPIC_API_KEY = os.environ["ANTHROPIC_API_KEY"]
-OBSIDIAN_API_KEY  = os.environ["OBSIDIAN_API_KEY"]
+# Imported only now: both read settings such as OBSIDIAN_RETRIES, OBSIDIAN_POOL_SIZE
+# and TOKEN_COUNTING from the environment at import time, and launchd only
+# provides them through .env
+from clients import anthropic_client, count_input_tokens
+from obsidian import ObsidianClient, ObsidianError, ObsidianUnavailable
+
 OBSIDIAN_HOST     = "localhost"
 OBSIDIAN_PORT     = os.environ.get("OBSIDIAN_PORT", "27123")
-OBSIDIAN_BASE_URL = f"http://{OBSIDIAN_HOST}:{OBSIDIAN_PORT}"
+OBSIDIAN_BASE_URL = os.environ.get("OBSIDIAN_BASE_URL", f"http://{OBSIDIAN_HOST}:{OBSIDIAN_PORT}")
+VAULT             = ObsidianClient(OBSIDIAN_BASE_URL)
 
 OBSIDIAN_FOLDER         = "Audio Summaries"
 WEEKLY_REPORT_SUBFOLDER = "Weekly Report Summaries"
@@ -75,6 +79,13 @@ SMTP_FROM  = os.environ.get("SMTP_FROM", SMTP_USER)
 LOOKBACK_DAYS = 7
 CLAUDE_MODEL  = "claude-sonnet-4-6"
 
+# Adaptive max_tokens — the report grows with the notes it covers; the request
+# gets twice the expected size as headroom, within these bounds
+REPORT_BASE_TOKENS            = 1000
+REPORT_TOKENS_PER_INPUT_TOKEN = 0.15
+REPORT_MIN_MAX_TOKENS         = 4096
+REPORT_MAX_MAX_TOKENS         = 16000
+
 # Compute date window once at startup
 NOW           = datetime.now()
 START_DATE    = NOW - timedelta(days=LOOKBACK_DAYS)
@@ -130,82 +141,55 @@ Output only the markdown document. Do not include any preamble or explanation.""
 # ---------------------------------------------------------------------------
 # Obsidian REST API helpers
 # ---------------------------------------------------------------------------
-def _obsidian_headers():
-    return {"Authorization": f"Bearer {OBSIDIAN_API_KEY}"}
-
-
 def list_notes(folder: str) -> list:
     """Return list of bare filenames in the given vault folder."""
-    url = f"{OBSIDIAN_BASE_URL}/vault/{folder}/"
     try:
-        resp = requests.get(url, headers=_obsidian_headers(), timeout=30)
-        resp.raise_for_status()
-        return resp.json().get("files", [])
-    except requests.exceptions.ConnectionError:
+        return VAULT.list(folder)
+    except ObsidianUnavailable:
         log.error("Cannot connect to Obsidian at %s \u2014 is Obsidian running?", OBSIDIAN_BASE_URL)
         sys.exit(1)
-    except requests.exceptions.Timeout:
-        log.error("Obsidian API timed out listing folder: %s", folder)
-        sys.exit(1)
-    except Exception as e:
+    except ObsidianError as e:
         log.error("Obsidian list_notes error: %s", e)
         sys.exit(1)
 
 
-def fetch_note(path: str) -> str:
-    """Fetch full markdown content of a note by its full vault path."""
-    url = f"{OBSIDIAN_BASE_URL}/vault/{path}"
-    try:
-        resp = requests.get(url, headers=_obsidian_headers(), timeout=30)
-        resp.raise_for_status()
-        return resp.text
-    except Exception as e:
-        log.error("Failed to fetch note %s: %s", path, e)
-        return ""
+def fetch_notes(paths: list) -> list:
+    """Fetch many notes concurrently; returns (path, content) in the given order.
 
+    Notes that are missing, empty or fail to fetch are logged and left out.
+    """
+    fetched, failed = VAULT.get_many(paths)
+    for path, error in failed.items():
+        log.error("Failed to fetch note %s: %s", path, error)
+    notes = []
+    for path in paths:
+        content = fetched.get(path)
+        if content:
+            notes.append((path, content))
+        elif path not in failed:
+            log.warning("Empty or missing note: %s", path)
+    return notes
 
-def move_note(src_path: str, dest_folder: str) -> bool:
-    """Move a note to dest_folder by copying then deleting the original."""
-    filename = os.path.basename(src_path)
-    dest_path = f"{dest_folder}/{filename}"
-    content = fetch_note(src_path)
-    if not content:
-        log.warning("Skipping move — could not fetch: %s", src_path)
-        return False
-    if not save_note(dest_path, content):
-        log.warning("Skipping move — failed to write destination: %s", dest_path)
-        return False
-    url = f"{OBSIDIAN_BASE_URL}/vault/{src_path}"
-    try:
-        resp = requests.delete(url, headers=_obsidian_headers(), timeout=30)
-        if resp.status_code in (200, 204):
-            log.info("Moved %s → %s", src_path, dest_path)
-            return True
-        log.warning("Delete failed HTTP %d for: %s", resp.status_code, src_path)
-        return False
-    except Exception as e:
-        log.error("Failed to delete %s: %s", src_path, e)
-        return False
+
+def move_notes(paths: list, dest_folder: str) -> int:
+    """Move notes to dest_folder concurrently. Returns how many were moved."""
+    moved, failed = VAULT.move_many(paths, dest_folder)
+    for src, dest in moved.items():
+        log.info("Moved %s \u2192 %s", src, dest)
+    for src, error in failed.items():
+        log.warning("Skipping move of %s: %s", src, error)
+    return len(moved)
 
 
 def save_note(path: str, content: str) -> bool:
     """Save markdown content to the vault at the given path."""
-    url = f"{OBSIDIAN_BASE_URL}/vault/{path}"
     try:
-        resp = requests.put(
-            url,
-            headers={**_obsidian_headers(), "Content-Type": "text/markdown"},
-            data=content.encode("utf-8"),
-            timeout=30,
-        )
-        success = resp.status_code in (200, 201, 204)
-        log.info("Obsidian save \u2192 HTTP %d | %s", resp.status_code, path)
-        if not success:
-            log.error("Obsidian save error: %s", resp.text[:300])
-        return success
-    except Exception as e:
+        status = VAULT.put(path, content)
+    except ObsidianError as e:
         log.error("Failed to save note %s: %s", path, e)
         return False
+    log.info("Obsidian save \u2192 HTTP %d | %s", status, path)
+    return True
 
 
 # ---------------------------------------------------------------------------
@@ -246,18 +230,22 @@ def synthesize_with_claude(notes: list) -> str:
 
     prompt = make_synthesis_prompt(START_DATE_STR, END_DATE_STR)
 
-    client = anthropic.Anthropic(
-        api_key=ANTHROPIC_API_KEY,
-        timeout=anthropic.Timeout(connect=10.0, read=300.0, write=30.0, pool=5.0),
-    )
-
-    log.info("Sending %d note(s) to Claude for synthesis...", len(notes))
+    client = anthropic_client(read_timeout=300.0)
+    params = {
+        "model": CLAUDE_MODEL,
+        "messages": [{"role": "user", "content": f"{prompt}\n\n---\n\n{notes_text}"}],
+    }
+    input_tokens, counted = count_input_tokens(params)
+    expected = REPORT_BASE_TOKENS + REPORT_TOKENS_PER_INPUT_TOKEN * input_tokens
+    params["max_tokens"] = int(min(REPORT_MAX_MAX_TOKENS, max(REPORT_MIN_MAX_TOKENS, 2 * expected)))
+
+    log.info("Sending %d note(s) to Claude for synthesis (input=%d tokens (%s), max_tokens=%d)...",
+             len(notes), input_tokens, counted, params["max_tokens"])
+    # Streamed, so the read timeout bounds the gap between tokens rather than
+    # the whole report, which at REPORT_MAX_MAX_TOKENS can take several minutes
     try:
-        response = client.messages.create(
-            model=CLAUDE_MODEL,
-            max_tokens=4096,
-            messages=[{"role": "user", "content": f"{prompt}\n\n---\n\n{notes_text}"}],
-        )
+        with client.messages.stream(**params) as stream:
+            response = stream.get_final_message()
     except anthropic.APITimeoutError:
         log.error("Claude API timed out during synthesis")
         sys.exit(1)
@@ -451,14 +439,7 @@ def main():
         log.info("  %s  (%s)", os.path.basename(path), dt.strftime("%Y-%m-%d"))
 
     # 3. Fetch full content of each note (list_notes returns bare filenames)
-    notes_with_content = []
-    for path, _ in matching:
-        vault_path = f"{OBSIDIAN_FOLDER}/{path}"
-        content = fetch_note(vault_path)
-        if content:
-            notes_with_content.append((vault_path, content))
-        else:
-            log.warning("Empty or failed fetch for: %s", vault_path)
+    notes_with_content = fetch_notes([f"{OBSIDIAN_FOLDER}/{path}" for path, _ in matching])
 
     if not notes_with_content:
         log.error("No note content could be fetched. Exiting without sending email.")
@@ -475,8 +456,8 @@ def main():
 
     # 6. Archive the daily reports that were included in the weekly report
     log.info("Archiving %d daily report(s) to 'Plaud Notes Archive'...", len(notes_with_content))
-    for vault_path, _ in notes_with_content:
-        move_note(vault_path, "Plaud Notes Archive")
+    moved = move_notes([vault_path for vault_path, _ in notes_with_content], "Plaud Notes Archive")
+    log.info("Archived %d of %d daily report(s)", moved, len(notes_with_content))
 
     # 7. Email the report (use the in-memory markdown, not a re-read from Obsidian)
     send_email(subject=REPORT_TITLE, body=report_md)